@@ -2,9 +2,15 @@ import streamlit as st
 import plotly.express as px
 import pandas as pd
 import time
-import requests
 import random
 from data_manager import DataManager
+import elections
+import export
+import history
+import instrumentation
+import public_ip
+import ranked
+import roster
 import utils 
 
 # Page Configuration
@@ -15,8 +21,26 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Initialize Data Manager
-dm = DataManager()
+# The active election decides the categories, the roster and where votes live
+election = elections.active()
+# ...and who wears which badge: utils.decorate_name looks names up in this
+names = roster.use(election.names())
+
+# Initialize Data Manager (one per election per process, shared by every session)
+@st.cache_resource
+def get_data_manager(data_file):
+    return DataManager(data_file)
+
+dm = get_data_manager(election.data_file)
+
+# Results shared by every session. Each is keyed on the store and its data version,
+# so 30 phones watching the leaderboard cost one computation per new ballot. The
+# live races use DataManager's own version-keyed memo instead, which reads the
+# tallies and their version together (get_versioned_tallies) so the version can
+# safely be the baseline for the next dm.changes_since().
+@st.cache_data(max_entries=4, show_spinner=False)
+def shared_voter_stats(data_file, version):
+    return get_data_manager(data_file).get_voter_stats()
 
 def check_password():
     """Returns True if the user had a correct password."""
@@ -46,15 +70,113 @@ def check_password():
     )
     return False
 
+# Live leaderboards poll every second while votes are arriving and back off
+# through these intervals (seconds) once results have been idle for IDLE_AFTER.
+LIVE_INTERVALS = (1, 2, 4, 8)
+IDLE_AFTER = 30
+
+def live_interval(key):
+    """Poll interval for the live fragment `key`, based on how long its results have been idle."""
+    state = st.session_state.get(f"live_{key}")
+    if not state:
+        return LIVE_INTERVALS[0]
+    step = int((time.time() - state["changed_at"]) // IDLE_AFTER)
+    return LIVE_INTERVALS[min(step, len(LIVE_INTERVALS) - 1)]
+
+def live_fragment(key, render):
+    """Runs render() as a fragment that reruns itself every live_interval(key) seconds.
+
+    Streamlit fixes run_every when a fragment is registered, and a fragment's own
+    reruns don't register it again. So when the interval it should poll at has
+    moved (idle long enough to back off, or votes arriving again) the whole app
+    reruns once to register it with the new one.
+    """
+    registered = live_interval(key)
+
+    def tick():
+        render()
+        if live_interval(key) != registered:
+            st.rerun(scope="app")
+
+    st.fragment(run_every=registered)(tick)()
+
+def apply_vote_changes(tallies, changes):
+    """tallies ({category: {candidate: count}}) moved forward by dm.changes_since() deltas.
+
+    Only categories already in tallies are tracked, and like the tallies themselves
+    only first choices of ranked ballots count; the input dicts are left untouched.
+    """
+    updated = dict(tallies)
+    copied = set()
+    for op, vote in changes:
+        category, candidate = vote.get("category"), vote.get("candidate")
+        if category not in updated or (vote.get("rank") or 1) != 1:
+            continue
+        if category not in copied:
+            updated[category] = dict(updated[category])
+            copied.add(category)
+        counts = updated[category]
+        counts[candidate] = counts.get(candidate, 0) + (1 if op == "add" else -1)
+        if counts[candidate] <= 0:
+            del counts[candidate]
+    return updated
+
+def race_html(category, tallies):
+    """One category's horse race; ranked categories run through their counting rounds."""
+    method = election.method(category)
+    if not method:
+        return utils.render_horse_race_html(category, tallies[category], election.roster)
+    result = dm.get_ranked_result(category, method, election.roster)
+    return utils.render_horse_race_html(category, None, election.roster, rounds=result["rounds"],
+                                        unit=ranked.UNITS[method])
+
+@instrumentation.timed("app.render_races")
+def render_races(categories, key):
+    """Draws the horse races, rebuilding the HTML only when the data version has moved.
+
+    A tick with no new votes costs one version check and re-emits the cached HTML.
+    Otherwise the session's tallies are moved forward with dm.changes_since(), so
+    the work depends on how many votes arrived rather than on how many there are.
+    """
+    version = dm.data_version()
+    state = st.session_state.get(f"live_{key}")
+    same_races = state is not None and state["data_file"] == election.data_file and state["categories"] == list(categories)
+    stale = not same_races or state["version"] != version
+    instrumentation.record_cache("app.render_races", not stale)
+    if stale:
+        changed = state is None or state["version"] != version
+        tallies = None
+        if same_races:
+            version, changes = dm.changes_since(state["version"])
+            if changes is not None:
+                tallies = apply_vote_changes(state["tallies"], changes)
+        if tallies is None:
+            version, all_tallies = dm.get_versioned_tallies()
+            tallies = {category: all_tallies.get(category, {}) for category in categories}
+        state = {
+            "data_file": election.data_file,
+            "version": version,
+            "categories": list(categories),
+            "changed_at": time.time() if changed else state["changed_at"],
+            "tallies": tallies,
+            "html": [race_html(category, tallies) for category in categories],
+        }
+        st.session_state[f"live_{key}"] = state
+
+    for html_str in state["html"]:
+        if hasattr(st, "html"):
+            st.html(html_str)
+        else:
+            st.markdown(html_str, unsafe_allow_html=True)
+
 # Helper for live updates
-if hasattr(st, "fragment"):
-    @st.fragment(run_every=1)
-    def render_leaderboard(categories, key_prefix="default"):
-        _internal_render_leaderboard(categories, key_prefix)
-else:
-    def render_leaderboard(categories, key_prefix="default"):
+def render_leaderboard(categories, key_prefix="default"):
+    if hasattr(st, "fragment"):
+        live_fragment(key_prefix, lambda: _internal_render_leaderboard(categories, key_prefix))
+    else:
         _internal_render_leaderboard(categories, key_prefix)
 
+@instrumentation.timed("app.render_leaderboard")
 def _internal_render_leaderboard(categories, key_prefix="default"):
     # Check if results are locked
     settings = dm.get_settings()
@@ -99,17 +221,10 @@ def _internal_render_leaderboard(categories, key_prefix="default"):
     race_container = st.container()
     
     with race_container:
-        df = dm.get_results_df()
-        
-        for category in categories:
-            try:
-                html_str = utils.render_horse_race_html(category, df)
-                if hasattr(st, "html"):
-                    st.html(html_str)
-                else:
-                    st.markdown(html_str, unsafe_allow_html=True)
-            except Exception as e:
-                st.error("Updating race track...")
+        try:
+            render_races(categories, key_prefix)
+        except Exception as e:
+            st.error("Updating race track...")
 
     if st.button("Refresh & Sync Everything 🔄", key=f"refresh_btn_{key_prefix}", use_container_width=True):
         st.session_state.voted = False
@@ -135,21 +250,13 @@ def get_voter_metadata():
             ip = val.split(",")[0].strip()
             break
     
-    # 3. Handle local testing
-    if ip == "Unknown" or ip.startswith("127.") or ip.startswith("192.168."):
-        try:
-            ip = requests.get('https://api.ipify.org', timeout=2).text
-        except:
-            pass
+    # 3. Handle local testing: use the public IP if we already know it, never wait for it
+    if public_ip.needs_lookup(ip) and external_ip_lookup_enabled():
+        ip = public_ip.cached() or ip
 
     # 4. Device Recognition
     ua = headers.get("User-Agent", headers.get("user-agent", "Unknown"))
-    device = "Desktop/Other"
-    if "iPhone" in ua: device = "iPhone"
-    elif "Android" in ua: device = "Android Phone"
-    elif "iPad" in ua: device = "iPad"
-    elif "Macintosh" in ua: device = "Mac Desktop"
-    elif "Windows" in ua: device = "Windows Desktop"
+    device = next((device for marker, device in utils.DEVICE_MARKERS if marker in ua), "Desktop/Other")
     
     return {
         "ip": ip, 
@@ -157,6 +264,17 @@ def get_voter_metadata():
         "raw_ua": ua
     }
 
+def external_ip_lookup_enabled():
+    """EXTERNAL_IP_LOOKUP = false in secrets turns off the api.ipify.org lookup entirely."""
+    return bool(st.secrets.get("EXTERNAL_IP_LOOKUP", True))
+
+def enrich_voter_ip(voter_name, metadata):
+    """Fills in the public IP after the ballot is saved, from a background lookup."""
+    if public_ip.needs_lookup(metadata["ip"]) and external_ip_lookup_enabled():
+        public_ip.resolve_in_background(
+            lambda ip: dm.update_voter_metadata(voter_name, {"ip": ip})
+        )
+
 def main():
     utils.load_css()
 
@@ -192,7 +310,7 @@ def main():
     if 'pleb_acknowledged' not in st.session_state:
         st.session_state.pleb_acknowledged = False
 
-    tab1, tab2, tab3, tab4 = st.tabs(["🗳️ Vote", "📊 Leaderboard", "📋 Voter Log", "🛠️ Admin"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["🗳️ Vote", "📊 Leaderboard", "📋 Voter Log", "🏛️ Hall of Fame", "🛠️ Admin"])
 
     with tab1:
         with st.container(border=True):
@@ -201,7 +319,7 @@ def main():
             with st.container(height=250):
                 voter_name = st.radio(
                     "Select your identity",
-                    options=utils.RANELADS,
+                    options=election.roster,
                     index=None,
                     label_visibility="collapsed",
                     key="voter_identity_radio"
@@ -218,22 +336,19 @@ def main():
                      st.info(f"Welcome back, {utils.decorate_name(voter_name)}! You have already cast your votes.")
                  
                  # Version-safe live leaderboard
+                 @instrumentation.timed("app.render_post_vote")
                  def render_post_vote():
-                     df = dm.get_results_df()
                      st.markdown("### 📈 Current Race Standings")
-                     for category in ["Ranelad of the Year", "Worst Ranelad of the Year", "Most Improved Ranelad"]:
-                         html_str = utils.render_horse_race_html(category, df)
-                         if hasattr(st, "html"): st.html(html_str)
-                         else: st.markdown(html_str, unsafe_allow_html=True)
+                     render_races(election.categories, "post_vote")
                  
                  if hasattr(st, "fragment"):
-                     st.fragment(run_every=1)(render_post_vote)()
+                     live_fragment("post_vote", render_post_vote)
                  else:
                      render_post_vote()
                      st.info("💡 Tip: Refresh to see new votes, or upgrade Streamlit for live updates!")
             else:
                 # Handle Con's special acknowledgement locally in tab1
-                if "Con" in voter_name and not st.session_state.con_acknowledged:
+                if names.badge(voter_name) == "💩💩" and not st.session_state.con_acknowledged:
                     dialog_func = getattr(st, "dialog", getattr(st, "experimental_dialog", None))
                     if dialog_func:
                         @dialog_func("⚠️ Mandatory Acknowledgement")
@@ -265,7 +380,7 @@ def main():
                             st.rerun()
                 
                 # Handle VIP Hall of Fame popup
-                elif "👑" in voter_name and not st.session_state.vip_acknowledged:
+                elif names.badge(voter_name) == "👑" and not st.session_state.vip_acknowledged:
                     dialog_func = getattr(st, "dialog", getattr(st, "experimental_dialog", None))
                     if dialog_func:
                         @dialog_func("👑 Hall of Fame Welcome")
@@ -345,14 +460,26 @@ def main():
                     # Show the actual voting form
                     with st.form("voting_form"):
                         st.markdown("### Cast Your Votes")
-                        categories = ["Ranelad of the Year", "Worst Ranelad of the Year", "Most Improved Ranelad"]
+                        categories = election.categories
                         votes_to_cast = {}
                         for category in categories:
                             with st.container(border=True):
                                 st.markdown(f"**{utils.get_category_emoji(category)} {category}**")
                                 # Filter out the voter's own name so they can't vote for themselves
-                                candidate_options = [r for r in utils.RANELADS if r != voter_name]
-                                
+                                candidate_options = [r for r in election.roster if r != voter_name]
+
+                                if election.method(category):
+                                    # Ranked ballot: the order picked is the order of preference
+                                    ranking = st.multiselect(
+                                        f"Rank the nominees for {category}",
+                                        options=candidate_options,
+                                        key=f"input_{category}",
+                                        placeholder="Tap your 1st choice, then your 2nd, ...",
+                                    )
+                                    if ranking:
+                                        votes_to_cast[category] = ranking
+                                    continue
+
                                 # Use a scrollable container with radio buttons to prevent keyboard popup
                                 with st.container(height=200):
                                     candidate = st.radio(
@@ -368,22 +495,20 @@ def main():
                             if not votes_to_cast:
                                 st.warning("Please vote for at least one category!")
                             else:
-                                success = True
                                 metadata = get_voter_metadata()
-                                for cat, name in votes_to_cast.items():
-                                    if not dm.save_vote(cat, name, voter_name, metadata=metadata):
-                                        success = False
-                                if success:
+                                if dm.save_ballot(voter_name, votes_to_cast, metadata=metadata):
+                                    enrich_voter_ip(voter_name, metadata)
                                     st.session_state.voted = True
                                     utils.show_celebration()
                                     time.sleep(6)
                                     st.rerun()
                                 else:
-                                    st.error("Something went wrong saving your votes.")
+                                    st.error("Looks like you've already voted! Only one ballot per Ranelad.")
         else:
             st.info("Please select your name above to start voting!")
 
     with tab2:
+        @instrumentation.timed("app.render_main_leaderboard")
         def render_main_leaderboard():
             # 1. Check Visibility
             settings = dm.get_settings()
@@ -419,14 +544,7 @@ def main():
                     """, unsafe_allow_html=True)
 
             # 3. Render Races
-            df = dm.get_results_df()
-            categories = ["Ranelad of the Year", "Worst Ranelad of the Year", "Most Improved Ranelad"]
-            for category in categories:
-                html_str = utils.render_horse_race_html(category, df)
-                if hasattr(st, "html"):
-                    st.html(html_str)
-                else:
-                    st.markdown(html_str, unsafe_allow_html=True)
+            render_races(election.categories, "main_tab")
             
             # Sync button
             if st.button("Refresh & Sync Everything 🔄", key="refresh_btn_main_tab", use_container_width=True):
@@ -438,23 +556,51 @@ def main():
                 st.rerun()
 
         if hasattr(st, "fragment"):
-            st.fragment(run_every=1)(render_main_leaderboard)()
+            live_fragment("main_tab", render_main_leaderboard)
         else:
             render_main_leaderboard()
             st.info("💡 Upgrade Streamlit to see horses move in real-time!")
 
     with tab3:
         st.markdown("### 📋 Voter Turnout")
-        voter_stats = dm.get_voter_stats()
+        voter_stats = shared_voter_stats(election.data_file, dm.data_version())
         if voter_stats.empty:
             st.info("No voters yet.")
         else:
             # Apply decoration to voter names in the dataframe
             if "Voter" in voter_stats.columns:
-                voter_stats["Voter"] = voter_stats["Voter"].apply(utils.decorate_name)
+                voter_stats["Voter"] = voter_stats["Voter"].map(names.display)
             st.dataframe(voter_stats, hide_index=True, use_container_width=True)
 
     with tab4:
+        st.markdown("### 🏛️ Hall of Fame")
+        past_categories = history.categories()
+        if not past_categories:
+            st.info("No finished events yet. Results land here whenever the votes are wiped.")
+        else:
+            hof_category = st.selectbox("Category", ["All categories"] + past_categories, key="hof_category")
+            chosen = None if hof_category == "All categories" else hof_category
+
+            fame = history.hall_of_fame(chosen)
+            fame["Nominee"] = fame["Nominee"].apply(utils.decorate_name)
+            st.dataframe(fame, hide_index=True, use_container_width=True)
+
+            st.markdown("#### 🏆 Past Winners")
+            past_winners = history.winners(chosen)
+            past_winners["Winner"] = past_winners["Winner"].apply(utils.decorate_name)
+            past_winners["Share"] = past_winners["Share"].map("{:.0%}".format)
+            st.dataframe(past_winners, hide_index=True, use_container_width=True)
+
+            if chosen:
+                trend = history.vote_share_trend(chosen)
+                if trend["Event"].nunique() > 1:
+                    st.markdown("#### 📈 Vote Share Over Time")
+                    trend["Nominee"] = trend["Nominee"].apply(utils.decorate_name)
+                    fig = px.line(trend, x="Event", y="Share", color="Nominee", markers=True)
+                    fig.update_yaxes(tickformat=".0%")
+                    st.plotly_chart(fig, use_container_width=True)
+
+    with tab5:
         st.markdown("### 🛠️ Admin Zone")
         st.warning("Danger Zone!")
         
@@ -510,7 +656,7 @@ def main():
                 else:
                     st.session_state.clear_clicks += 1
                     if st.session_state.clear_clicks >= 10:
-                        dm.clear_votes()
+                        dm.clear_votes(election.title, election.ranked, election.roster)
                         st.session_state.clear_clicks = 0
                         st.session_state.voted = False
                         st.session_state.con_acknowledged = False
@@ -549,6 +695,137 @@ def main():
                     else:
                         st.error("Wrong password")
 
+        st.divider()
+
+        # Section 4: Performance metrics
+        with st.container(border=True):
+            st.markdown("#### ⏱️ Performance")
+            if not st.session_state.get("metrics_unlocked", False):
+                metrics_pass = st.text_input("Enter DELPASS to view metrics", type="password", key="metrics_pass")
+                if st.button("Show Metrics", use_container_width=True):
+                    if "DELPASS" in st.secrets and metrics_pass == st.secrets["DELPASS"]:
+                        st.session_state.metrics_unlocked = True
+                        st.rerun()
+                    else:
+                        st.error("Incorrect password")
+            else:
+                metrics_on = st.toggle("Record metrics (this server process)", value=instrumentation.enabled())
+                if metrics_on != instrumentation.enabled():
+                    instrumentation.enable(metrics_on)
+
+                snap = instrumentation.snapshot()
+                if snap["calls"]:
+                    calls_df = pd.DataFrame([
+                        {"Function": name, "Calls": c["count"], "Total ms": c["total_seconds"] * 1000,
+                         "Mean ms": c["mean_seconds"] * 1000, "Max ms": c["max_seconds"] * 1000}
+                        for name, c in snap["calls"].items()
+                    ]).sort_values("Total ms", ascending=False)
+                    st.dataframe(calls_df, hide_index=True, use_container_width=True)
+                else:
+                    st.info("No calls recorded yet.")
+                if snap["bytes"]:
+                    st.dataframe(pd.DataFrame([
+                        {"Storage": name, "Bytes Read": b["read"], "Bytes Written": b["written"]}
+                        for name, b in snap["bytes"].items()
+                    ]), hide_index=True, use_container_width=True)
+                if snap["caches"]:
+                    st.dataframe(pd.DataFrame([
+                        {"Cache": name, "Hits": c["hits"], "Misses": c["misses"], "Hit Rate": f"{c['hit_rate']:.0%}"}
+                        for name, c in snap["caches"].items()
+                    ]), hide_index=True, use_container_width=True)
+
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.download_button("📥 JSON", data=instrumentation.to_json(),
+                                       file_name="roty_metrics.json", mime="application/json", use_container_width=True)
+                with col2:
+                    st.download_button("📥 Prometheus", data=instrumentation.to_prometheus(),
+                                       file_name="roty_metrics.prom", mime="text/plain", use_container_width=True)
+                with col3:
+                    if st.button("Reset", key="metrics_reset", use_container_width=True):
+                        instrumentation.reset()
+                        st.rerun()
+
+        st.divider()
+
+        # Section 5: Elections
+        with st.container(border=True):
+            st.markdown("#### 🗳️ Elections")
+            st.info(f"Active election: {election.title}")
+            if not st.session_state.get("elections_unlocked", False):
+                elections_pass = st.text_input("Enter DELPASS to manage elections", type="password", key="elections_pass")
+                if st.button("Manage Elections", use_container_width=True):
+                    if "DELPASS" in st.secrets and elections_pass == st.secrets["DELPASS"]:
+                        st.session_state.elections_unlocked = True
+                        st.rerun()
+                    else:
+                        st.error("Incorrect password")
+            else:
+                all_elections = elections.all_elections()
+                st.dataframe(pd.DataFrame([
+                    {"Election": e.id, "Title": e.title, "Categories": len(e.categories), "Roster": len(e.roster),
+                     "Status": "🟢 Active" if e.id == election.id else ("📦 Archived" if e.archived else "Open")}
+                    for e in all_elections
+                ]), hide_index=True, use_container_width=True)
+
+                open_ids = [e.id for e in all_elections if not e.archived and e.id != election.id]
+                if open_ids:
+                    chosen = st.selectbox("Election", open_ids, key="election_choice")
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        if st.button("Make Active", use_container_width=True):
+                            elections.set_active(chosen)
+                            st.toast(f"{chosen} is now the active election!", icon="🗳️")
+                            time.sleep(1)
+                            st.rerun()
+                    with col2:
+                        if st.button("📦 Archive (read-only)", use_container_width=True):
+                            elections.archive(chosen)
+                            st.toast(f"Archived {chosen}", icon="📦")
+                            time.sleep(1)
+                            st.rerun()
+
+                archived = [e for e in all_elections if e.archived]
+                if archived:
+                    past = st.selectbox("Past results", [e.id for e in archived], index=None, key="archived_choice")
+                    if past:
+                        past_election = elections.get(past)
+                        past_results = past_election.data_manager().get_results(past_election.ranked, past_election.roster)
+                        st.dataframe(pd.DataFrame([
+                            {"Category": category, "Method": ranked.METHODS.get(result["method"], "Single choice"),
+                             "Nominee": utils.decorate_name(candidate) + (" 🏆" if candidate in result["winners"] else ""),
+                             "Score": score, "Unit": ranked.UNITS.get(result["method"], "votes")}
+                            for category, result in past_results.items()
+                            for candidate, score in sorted(result["scores"].items(), key=lambda c: -c[1])
+                        ]), hide_index=True, use_container_width=True)
+
+                with st.form("new_election"):
+                    st.markdown("**New election**")
+                    new_id = st.text_input("ID (e.g. roty-2026)")
+                    new_title = st.text_input("Title")
+                    new_categories = st.text_area("Categories (one per line)", "\n".join(election.categories))
+                    new_roster = st.text_area("Roster (one per line)", "\n".join(election.roster))
+                    new_badges = st.text_area("Badges (badge: names, one badge per line)", roster.format_badges(election.badges))
+                    ballot_options = {None: "Single choice", **{m: f"Ranked: {label}" for m, label in ranked.METHODS.items()}}
+                    new_method = st.selectbox("Ballot", list(ballot_options), format_func=ballot_options.get)
+                    activate = st.checkbox("Make it the active election")
+                    if st.form_submit_button("Create Election", use_container_width=True):
+                        category_list = [c.strip() for c in new_categories.splitlines() if c.strip()]
+                        try:
+                            elections.create(
+                                new_id.strip(), new_title.strip() or None, category_list,
+                                [r.strip() for r in new_roster.splitlines() if r.strip()],
+                                activate=activate,
+                                ranked={c: new_method for c in category_list} if new_method else None,
+                                badges=roster.parse_badges(new_badges),
+                            )
+                        except ValueError as e:
+                            st.error(str(e))
+                        else:
+                            st.toast(f"Created {new_id}", icon="🗳️")
+                            time.sleep(1)
+                            st.rerun()
+
     # --- Secret Sidebar Breakdown ---
     with st.sidebar:
         st.markdown("### 🕵️ God View")
@@ -570,33 +847,36 @@ def main():
                 st.rerun()
                 
             st.markdown("#### 🗳️ Detailed Vote Log")
-            votes = dm.load_votes()
-            if not votes:
+            total_votes = dm.count_votes()
+            if not total_votes:
                 st.info("No votes cast yet.")
             else:
-                # Prepare data for display
-                detailed_data = []
-                for v in votes:
-                    detailed_data.append({
-                        "Voter": utils.decorate_name(v.get("voter", "Unknown")),
-                        "Category": v.get("category", "Unknown"),
-                        "Nominee": utils.decorate_name(v.get("candidate", "Unknown")),
-                        "Time": pd.to_datetime(v.get("timestamp")).strftime('%H:%M:%S') if v.get("timestamp") else "Unknown"
-                    })
-                
-                df_detailed = pd.DataFrame(detailed_data)
+                # Only the visible page is materialised
+                page_size = 50
+                pages = (total_votes + page_size - 1) // page_size
+                page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1, key="vote_log_page")
+                page_votes = dm.get_votes_page((page - 1) * page_size, page_size)
+                df_detailed = pd.DataFrame([export.display_row(v) for v in page_votes], columns=export.COLUMNS)
                 # Show table without index for a cleaner look
                 st.dataframe(df_detailed, hide_index=True, use_container_width=True)
                 
-                # Option to download as CSV for record keeping
-                csv = df_detailed.to_csv(index=False).encode('utf-8')
+                # Option to download for record keeping; the file is only built when clicked
+                stamp = pd.Timestamp.now().strftime('%Y%m%d_%H%M')
                 st.download_button(
                     label="📥 Download CSV",
-                    data=csv,
-                    file_name=f"roty_votes_detailed_{pd.Timestamp.now().strftime('%Y%m%d_%H%M')}.csv",
+                    data=lambda: export.csv_bytes(dm),
+                    file_name=f"roty_votes_detailed_{stamp}.csv",
                     mime="text/csv",
                     use_container_width=True
                 )
+                if export.parquet_available():
+                    st.download_button(
+                        label="📥 Download Parquet",
+                        data=lambda: export.parquet_file(dm),
+                        file_name=f"roty_votes_detailed_{stamp}.parquet",
+                        mime="application/vnd.apache.parquet",
+                        use_container_width=True
+                    )
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,286 @@
+"""Storage benchmarks for DataManager.
+
+Usage:
+    python benchmark.py stress [--processes 4] [--threads 8] [--votes 250] [--backend json|sqlite|sharded]
+    python benchmark.py voter-stats [--votes 100000] [--backend json|sqlite|sharded]
+    python benchmark.py memory [--votes 1000000]
+    python benchmark.py delete [--votes 100000] [--deletes 20] [--backend json|sqlite|sharded]
+    python benchmark.py ranked [--ballots 100000] [--backend json|sqlite|sharded]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+import ranked
+import utils
+from columnar import VoteColumns
+from data_manager import DataManager
+from elections import DEFAULT_CATEGORIES as CATEGORIES
+from utils import DEVICES
+
+STORE_NAMES = {"json": "votes.json", "sqlite": "votes.db", "sharded": "votes.shards"}
+
+
+def synthetic_votes(count, seed=0):
+    """count votes as full ballots (one per category) from distinct voters, oldest first."""
+    rng = random.Random(seed)
+    start = datetime(2025, 12, 20, 20, 0)
+    votes = []
+    for i in range(count):
+        voter = f"voter-{i // len(CATEGORIES)}"
+        if i % len(CATEGORIES) == 0:
+            # One device per ballot, like the app's save_ballot
+            metadata = {
+                "ip": f"10.0.{rng.randrange(256)}.{rng.randrange(256)}",
+                "user_agent": rng.choice(DEVICES),
+                "raw_ua": "Synthetic/1.0",
+            }
+        votes.append({
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "candidate": f"candidate-{rng.randrange(22)}",
+            "timestamp": (start + timedelta(milliseconds=i)).isoformat(),
+            "voter": voter,
+            "metadata": dict(metadata),
+        })
+    return votes
+
+
+def seeded_store(tmp, count, backend="json"):
+    """A DataManager on a fresh store in tmp holding count synthetic votes."""
+    dm = DataManager(os.path.join(tmp, STORE_NAMES[backend]))
+    dm.storage.append_votes(synthetic_votes(count))
+    dm.compact()
+    return dm
+
+
+def timed(fn, repeat=3):
+    """Best wall time of fn() over repeat runs, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _stress_worker(file_path, worker_id, threads, votes_per_thread):
+    """Hammers save_vote from several threads inside one process."""
+    def run(thread_id):
+        dm = DataManager(file_path)
+        for i in range(votes_per_thread):
+            voter = f"voter-{worker_id}-{thread_id}-{i}"
+            dm.save_vote(CATEGORIES[i % len(CATEGORIES)], f"candidate-{i % 7}", voter)
+
+    pool = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+
+def stress(processes, threads, votes_per_thread, backend="json"):
+    """Fires concurrent save_vote calls from several processes and checks none were lost."""
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = os.path.join(tmp, STORE_NAMES[backend])
+        DataManager(file_path)
+
+        start = time.perf_counter()
+        workers = [
+            multiprocessing.Process(target=_stress_worker, args=(file_path, p, threads, votes_per_thread))
+            for p in range(processes)
+        ]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - start
+
+        expected = processes * threads * votes_per_thread
+        stored = len(DataManager(file_path).load_votes())
+        lost = expected - stored
+
+        print(f"⚙️  [{backend}] {processes} processes x {threads} threads x {votes_per_thread} votes")
+        print(f"   Stored {stored}/{expected} votes in {elapsed:.2f}s ({expected / elapsed:.0f} votes/s)")
+        if lost:
+            print(f"❌ {lost} votes lost!")
+        else:
+            print("✅ No votes lost.")
+        return lost == 0
+
+
+def voter_stats(count, backend="json"):
+    """Times an uncached get_voter_stats over count votes."""
+    with tempfile.TemporaryDirectory() as tmp:
+        dm = seeded_store(tmp, count, backend)
+        elapsed = timed(dm._build_voter_stats)
+        rows = len(dm.get_voter_stats())
+        print(f"⚙️  [{backend}] get_voter_stats over {count} votes / {rows} voters: {elapsed * 1000:.1f} ms")
+
+
+def delete(count, deletes, backend="json"):
+    """Times deleting voters from a store of count votes, and the compaction that follows."""
+    with tempfile.TemporaryDirectory() as tmp:
+        dm = seeded_store(tmp, count, backend)
+        voters = dm.list_voters()[:deletes]
+        times = []
+        for voter in voters:
+            start = time.perf_counter()
+            dm.delete_votes_for_voter(voter)
+            dm.get_tallies()
+            times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        dm.compact()
+        compact_time = time.perf_counter() - start
+        print(f"⚙️  [{backend}] {len(voters)} voter deletes over {count} votes")
+        print(f"   delete + tallies: {sum(times) / len(times) * 1000:8.2f} ms avg, {max(times) * 1000:8.2f} ms max")
+        print(f"   compact():        {compact_time * 1000:8.1f} ms (in the background in the app)")
+
+
+def synthetic_rankings(count, candidates=22, seed=0):
+    """count ranked ballots of 1-5 choices over candidates nominees, a few of them favourites."""
+    rng = random.Random(seed)
+    names = [f"candidate-{i}" for i in range(candidates)]
+    weights = [1 / (i + 1) for i in range(candidates)]
+    rankings = []
+    for _ in range(count):
+        ranking = []
+        for _ in range(rng.randint(1, 5)):
+            pick = rng.choices(names, weights)[0]
+            if pick not in ranking:
+                ranking.append(pick)
+        rankings.append(ranking)
+    return rankings
+
+
+def _rescan_runoff(ballots):
+    """Textbook instant runoff that re-reads every ballot each round, for comparison."""
+    continuing = {c for ballot in ballots for c in ballot}
+    while True:
+        counts = dict.fromkeys(continuing, 0)
+        for ballot, count in ballots.items():
+            for candidate in ballot:
+                if candidate in continuing:
+                    counts[candidate] += count
+                    break
+        leader, lowest = max(counts.values()), min(counts.values())
+        if leader * 2 > sum(counts.values()) or leader == lowest:
+            return counts
+        continuing -= {c for c, votes in counts.items() if votes == lowest}
+
+
+def ranked_tallies(count, backend="json"):
+    """Times the ranked-choice engine, and reading the ballots back from a store, at count ballots."""
+    # A category nobody has ranked yet still has to count and draw (everyone at the gate)
+    for method in ranked.METHODS:
+        result = ranked.tally(method, {}, ["A", "B"])
+        assert "gate" in utils.render_horse_race_html(CATEGORIES[0], None, ["A", "B"], rounds=result["rounds"],
+                                                      unit=ranked.UNITS[method])
+
+    rankings = synthetic_rankings(count)
+    ballots = ranked.count_ballots(rankings)
+    print(f"⚙️  {count} ranked ballots, {len(ballots)} distinct")
+    print(f"   count_ballots():        {timed(lambda: ranked.count_ballots(rankings)) * 1000:8.1f} ms")
+    result = ranked.instant_runoff(ballots)
+    print(f"   instant_runoff():       {timed(lambda: ranked.instant_runoff(ballots)) * 1000:8.1f} ms ({len(result['rounds'])} rounds)")
+    print(f"   ...re-scanning rounds:  {timed(lambda: _rescan_runoff(ballots)) * 1000:8.1f} ms")
+    print(f"   borda():                {timed(lambda: ranked.borda(ballots)) * 1000:8.1f} ms")
+    print(f"   condorcet():            {timed(lambda: ranked.condorcet(ballots)) * 1000:8.1f} ms")
+
+    start = datetime(2025, 12, 20, 20, 0)
+    votes = [
+        {"category": CATEGORIES[0], "candidate": candidate, "timestamp": (start + timedelta(milliseconds=i)).isoformat(),
+         "voter": f"voter-{i}", "rank": rank}
+        for i, ranking in enumerate(rankings)
+        for rank, candidate in enumerate(ranking, start=1)
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        dm = DataManager(os.path.join(tmp, STORE_NAMES[backend]))
+        dm.storage.append_votes(votes)
+        dm.compact()
+        elapsed = timed(lambda: dm.storage.ranked_ballots(CATEGORIES[0]))
+        assert dm.storage.ranked_ballots(CATEGORIES[0]) == ballots
+        print(f"   [{backend}] ranked_ballots() over {len(votes)} votes: {elapsed * 1000:8.1f} ms")
+
+
+def _traced(build):
+    """(result of build(), bytes it still holds once built) as seen by tracemalloc."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def memory(count):
+    """Compares the in-memory size of count votes as dicts against VoteColumns."""
+    # Round-trip through JSON lines so every vote owns its strings, as after loading votes.json
+    lines = [json.dumps(v) for v in synthetic_votes(count)]
+
+    dicts, dict_bytes = _traced(lambda: [json.loads(line) for line in lines])
+    del dicts
+
+    def build_columns():
+        columns = VoteColumns()
+        for line in lines:
+            columns.append(json.loads(line))
+        return columns
+
+    columns, column_bytes = _traced(build_columns)
+    frame_time = timed(columns.to_frame)
+
+    print(f"⚙️  {count} votes in memory")
+    print(f"   list of dicts: {dict_bytes / 2**20:8.1f} MiB")
+    print(f"   VoteColumns:   {column_bytes / 2**20:8.1f} MiB ({dict_bytes / column_bytes:.1f}x smaller)")
+    print(f"   to_frame():    {frame_time * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("stress", help="concurrent save_vote calls, checks for lost votes")
+    p.add_argument("--processes", type=int, default=4)
+    p.add_argument("--threads", type=int, default=8)
+    p.add_argument("--votes", type=int, default=250, help="votes per thread")
+    p.add_argument("--backend", choices=sorted(STORE_NAMES), default="json")
+
+    p = sub.add_parser("voter-stats", help="time the Voter Log computation")
+    p.add_argument("--votes", type=int, default=100_000)
+    p.add_argument("--backend", choices=sorted(STORE_NAMES), default="json")
+
+    p = sub.add_parser("memory", help="size of the in-memory vote representation")
+    p.add_argument("--votes", type=int, default=1_000_000)
+
+    p = sub.add_parser("delete", help="time voter deletes and the compaction after them")
+    p.add_argument("--votes", type=int, default=100_000)
+    p.add_argument("--deletes", type=int, default=20)
+    p.add_argument("--backend", choices=sorted(STORE_NAMES), default="json")
+
+    p = sub.add_parser("ranked", help="time the ranked-choice tallies")
+    p.add_argument("--ballots", type=int, default=100_000)
+    p.add_argument("--backend", choices=sorted(STORE_NAMES), default="json")
+
+    args = parser.parse_args()
+    if args.command == "stress":
+        ok = stress(args.processes, args.threads, args.votes, args.backend)
+        raise SystemExit(0 if ok else 1)
+    elif args.command == "voter-stats":
+        voter_stats(args.votes, args.backend)
+    elif args.command == "memory":
+        memory(args.votes)
+    elif args.command == "delete":
+        delete(args.votes, args.deletes, args.backend)
+    elif args.command == "ranked":
+        ranked_tallies(args.ballots, args.backend)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""Compact column-wise storage for votes held in memory.
+
+A vote dict repeats its category, candidate and voter strings, an ISO
+timestamp string and a metadata dict. VoteColumns instead interns those
+strings to small integer ids kept in `array` columns, stores timestamps as
+epoch microseconds, and keeps one copy of each distinct metadata record.
+Vote dicts are only materialised when somebody asks for them.
+
+Deleting votes only flags their rows (delete()); purge() drops flagged rows
+in one pass, so a run of deletes doesn't rebuild the columns each time.
+"""
+import json
+from array import array
+from datetime import datetime, timedelta
+from itertools import compress, islice
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_ALIVE = bytes.maketrans(b"\x00\x01", b"\x01\x00")  # deleted flags -> keep flags
+
+
+def to_epoch_us(timestamp):
+    """Naive isoformat() string -> integer microseconds since the epoch."""
+    return (datetime.fromisoformat(timestamp) - _EPOCH) // _MICROSECOND
+
+
+def from_epoch_us(value):
+    """Inverse of to_epoch_us; gives back the same isoformat() string."""
+    return (_EPOCH + timedelta(microseconds=value)).isoformat()
+
+
+class Interner:
+    """Maps values to dense integer ids and back. None is always id -1."""
+
+    def __init__(self):
+        self.values = []
+        self.ids = {}
+
+    def id(self, value):
+        if value is None:
+            return -1
+        found = self.ids.get(value)
+        if found is None:
+            found = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return found
+
+    def value(self, value_id):
+        return None if value_id < 0 else self.values[value_id]
+
+
+class VoteColumns:
+    """Votes as parallel columns of interned ids, in the order they were added."""
+
+    def __init__(self):
+        self.categories = Interner()
+        self.candidates = Interner()
+        self.voters = Interner()
+        self.metadata = Interner()   # canonical JSON text -> id
+        self.metadata_records = []   # id -> metadata dict, shared by every vote that has it
+        self.category = array("i")
+        self.candidate = array("i")
+        self.voter = array("i")
+        self.timestamp = array("q")
+        self.meta = array("i")
+        self.rank = array("i")  # preference on a ranked ballot, 0 for a plain vote
+        self.deleted = array("b")  # 1 for rows removed by delete() but not purged yet
+        self.deleted_count = 0
+
+    def __len__(self):
+        """Number of votes, not counting deleted rows."""
+        return len(self.timestamp) - self.deleted_count
+
+    def _metadata_id(self, metadata):
+        if not metadata:
+            return -1
+        key = json.dumps(metadata, sort_keys=True)
+        before = len(self.metadata.values)
+        meta_id = self.metadata.id(key)
+        if meta_id == before:
+            self.metadata_records.append(metadata)
+        return meta_id
+
+    def _push(self, name, value):
+        column = getattr(self, name)
+        try:
+            column.append(value)
+        except BufferError:
+            # A DataFrame from to_frame() still views this buffer: copy on write
+            column = array(column.typecode, column)
+            column.append(value)
+            setattr(self, name, column)
+
+    def append(self, vote):
+        """Adds a vote dict and returns its row number."""
+        # Convert everything before touching a column, so a bad vote can't leave them misaligned
+        row = {
+            "category": self.categories.id(vote.get("category")),
+            "candidate": self.candidates.id(vote.get("candidate")),
+            "voter": self.voters.id(vote.get("voter")),
+            "meta": self._metadata_id(vote.get("metadata")),
+            "timestamp": to_epoch_us(vote["timestamp"]),
+            "rank": int(vote.get("rank") or 0),
+            "deleted": 0,
+        }
+        for name, value in row.items():
+            self._push(name, value)
+        return len(self.timestamp) - 1
+
+    def vote(self, row):
+        """Row as the usual vote dict. Its metadata dict is shared; don't mutate it."""
+        vote = {
+            "category": self.categories.value(self.category[row]),
+            "candidate": self.candidates.value(self.candidate[row]),
+            "timestamp": from_epoch_us(self.timestamp[row]),
+            "voter": self.voters.value(self.voter[row]),
+        }
+        if self.meta[row] >= 0:
+            vote["metadata"] = self.metadata_records[self.meta[row]]
+        if self.rank[row]:
+            vote["rank"] = self.rank[row]
+        return vote
+
+    def live_rows(self, start=0, stop=None):
+        """Row numbers of the start-th up to the stop-th vote that hasn't been deleted."""
+        total = len(self.timestamp)
+        if not self.deleted_count:
+            return range(start, total if stop is None else min(stop, total))
+        return islice(compress(range(total), bytes(self.deleted).translate(_ALIVE)), start, stop)
+
+    def votes(self, start=0, stop=None):
+        return [self.vote(row) for row in self.live_rows(start, stop)]
+
+    def voter_of(self, row):
+        return self.voters.value(self.voter[row])
+
+    def set_metadata(self, row, metadata):
+        self.meta[row] = self._metadata_id(metadata)
+
+    def delete(self, row):
+        """Flags a row as deleted. It stays in the columns until purge()."""
+        if not self.deleted[row]:
+            self.deleted[row] = 1
+            self.deleted_count += 1
+
+    def purge(self):
+        """Drops the deleted rows, preserving order. Row numbers change; returns False if nothing did."""
+        if not self.deleted_count:
+            return False
+        keep = bytes(self.deleted).translate(_ALIVE)
+        for name in ("category", "candidate", "voter", "timestamp", "meta", "rank"):
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode, compress(column, keep)))
+        self.deleted = array("b", bytes(len(self.timestamp)))
+        self.deleted_count = 0
+        return True
+
+    def rows_by_voter(self):
+        by_voter = {}
+        for row, (voter_id, deleted) in enumerate(zip(self.voter, self.deleted)):
+            if not deleted:
+                by_voter.setdefault(self.voters.value(voter_id), []).append(row)
+        return by_voter
+
+    def ranked_ballots(self, category):
+        """{(first choice, second, ...): voters} for category; plain votes count as rank 1."""
+        category_id = self.categories.ids.get(category)
+        if category_id is None:
+            return {}
+        rankings = {}  # voter id (or -row for votes without a voter) -> [(rank, candidate id)]
+        for row, (row_category, voter_id, rank, deleted) in enumerate(
+            zip(self.category, self.voter, self.rank, self.deleted)
+        ):
+            if row_category == category_id and not deleted:
+                rankings.setdefault(voter_id if voter_id >= 0 else -row - 1, []).append((rank or 1, self.candidate[row]))
+        ballots = {}
+        for choices in rankings.values():
+            choices.sort()
+            ballot = tuple(self.candidates.values[candidate_id] for _, candidate_id in choices)
+            ballots[ballot] = ballots.get(ballot, 0) + 1
+        return ballots
+
+    def voter_summaries(self):
+        """Per-voter DataFrame, as Storage.voter_summaries.
+
+        Reduced by pandas over views of the id and timestamp columns, so nothing
+        is done per vote in Python.
+        """
+        import numpy as np
+        import pandas as pd
+
+        frame = pd.DataFrame({
+            "voter": np.frombuffer(self.voter, dtype=np.int32),
+            "timestamp": np.frombuffer(self.timestamp, dtype=np.int64),
+            "meta": np.frombuffer(self.meta, dtype=np.int32),
+            # A ranked ballot is one vote in its category, however many preferences it lists
+            "first": np.frombuffer(self.rank, dtype=np.int32) <= 1,
+        })
+        keep = frame["voter"].to_numpy() >= 0
+        if self.deleted_count:
+            keep &= np.frombuffer(self.deleted, dtype=np.int8) == 0
+        frame = frame[keep]
+        if frame.empty:
+            return pd.DataFrame(columns=["voter", "votes", "last", "metadata"])
+        stats = frame.groupby("voter", sort=False).agg(votes=("first", "sum"), last=("timestamp", "max"))
+        # The frame keeps row numbers as its index; idxmax() gives the first row among equal timestamps
+        with_meta = frame[frame["meta"].to_numpy() >= 0]
+        latest = with_meta.groupby("voter", sort=False)["timestamp"].idxmax()
+        meta_ids = pd.Series(np.frombuffer(self.meta, dtype=np.int32)[latest.to_numpy()], index=latest.index)
+        records = np.empty(len(self.metadata_records) + 1, dtype=object)  # the extra last slot is None, for id -1
+        records[:-1] = self.metadata_records
+        names = np.empty(len(self.voters.values), dtype=object)
+        names[:] = self.voters.values
+        return pd.DataFrame({
+            "voter": names[stats.index.to_numpy()],
+            "votes": stats["votes"].to_numpy(),
+            "last": stats["last"].to_numpy().view("datetime64[us]"),
+            "metadata": records[meta_ids.reindex(stats.index, fill_value=-1).to_numpy()],
+        })
+
+    def to_frame(self):
+        """category/candidate/voter/timestamp DataFrame built from the columns.
+
+        The string columns are Categoricals over the interned values, so no per-row
+        strings are created; timestamps are a datetime64 view of the epoch column.
+        Deleted rows are filtered out.
+        """
+        import numpy as np
+        import pandas as pd
+
+        def categorical(column, interner):
+            return pd.Categorical.from_codes(np.frombuffer(column, dtype=np.int32), categories=interner.values)
+
+        frame = pd.DataFrame({
+            "category": categorical(self.category, self.categories),
+            "candidate": categorical(self.candidate, self.candidates),
+            "voter": categorical(self.voter, self.voters),
+            "timestamp": np.frombuffer(self.timestamp, dtype=np.int64).view("datetime64[us]"),
+        })
+        if self.deleted_count:
+            frame = frame[np.frombuffer(self.deleted, dtype=np.int8) == 0].reset_index(drop=True)
+        return frame
@@ -1,160 +1,276 @@
-import json
 import os
+import threading
+import numpy as np
 import pandas as pd
 from datetime import datetime
+import history
+import instrumentation
+import ranked
+import write_behind
+from storage import open_storage
 
-DATA_FILE = "votes.json"
+# Point ROTY_DATA_FILE at a .db/.sqlite file to use the SQLite backend
+DATA_FILE = os.environ.get("ROTY_DATA_FILE", "votes.json")
 
+_memo = {}  # (storage key, name) -> (data version, value), shared by every DataManager
+_memo_lock = threading.Lock()
+
+@instrumentation.instrument_public_methods("DataManager")
 class DataManager:
-    def __init__(self, file_path=DATA_FILE):
+    def __init__(self, file_path=DATA_FILE, backend=None):
         self.file_path = file_path
-        self._ensure_file_exists()
-
-    def _ensure_file_exists(self):
-        if not os.path.exists(self.file_path):
-            initial_data = {
-                "votes": [],
-                "settings": {
-                    "results_locked": False
-                }
-            }
-            with open(self.file_path, "w") as f:
-                json.dump(initial_data, f, indent=4)
-        else:
-            # Migration: Ensure settings key exists in existing file
-            data = self._read_all()
-            if "settings" not in data:
-                data["settings"] = {"results_locked": False}
-                self._write_all(data)
-
-    def _read_all(self):
-        try:
-            with open(self.file_path, "r") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return {"votes": [], "settings": {"results_locked": False}}
-
-    def _write_all(self, data):
-        with open(self.file_path, "w") as f:
-            json.dump(data, f, indent=4)
+        self.storage = open_storage(file_path, backend)
+
+    def _cached(self, name, build, detail=()):
+        """Returns build() memoised on the storage's data version.
+
+        name is also the cache's metric label, so it stays fixed; whatever else
+        tells the cached values apart (a category, a method) goes in detail.
+        """
+        key = (self.storage.key, name, *detail)
+        version = self.storage.version()
+        with _memo_lock:
+            cached = _memo.get(key)
+        hit = cached is not None and cached[0] == version
+        instrumentation.record_cache(f"DataManager.{name}", hit)
+        if hit:
+            return cached[1]
+        value = build()
+        # A write that landed while building may already be in value; don't file it under the old version
+        if self.storage.version() == version:
+            with _memo_lock:
+                _memo[key] = (version, value)
+        return value
+
+    def data_version(self):
+        """Change counter for the stored votes and settings.
+
+        Cheap enough to call on every live tick; if it equals the value seen
+        last time, nothing has changed and cached results can be reused.
+        """
+        return self.storage.version()
+
+    def changes_since(self, version):
+        """(current version, changes) where changes lists the ("add" | "delete", vote)
+        pairs since version, or is None if the caller should reload in full."""
+        return self.storage.changes_since(version)
+
+    def compact(self):
+        """Lets the backend fold its write log into the main file."""
+        self.storage.compact()
+
+    def flush(self):
+        """Forces any batched writes to disk, including queued ballots."""
+        write_behind.writer_for(self.storage).flush()
+        self.storage.flush()
 
     def load_votes(self):
-        return self._read_all().get("votes", [])
+        return self.storage.load_votes()
+
+    def count_votes(self):
+        return self.storage.count_votes()
+
+    def get_votes_page(self, offset, limit):
+        """A page of votes in the order they were cast, for paginated tables."""
+        return self.storage.votes_page(offset, limit)
 
-    def save_vote(self, category, candidate, voter_name, metadata=None):
-        data = self._read_all()
+    def iter_votes(self, chunk_size=1000):
+        """Yields every vote in lists of up to chunk_size, without loading them all at once."""
+        return self.storage.iter_votes(chunk_size)
+
+    def get_votes_df(self):
+        """Every vote as a category/candidate/voter/timestamp DataFrame with categorical string columns."""
+        return self._cached("votes_df", self.storage.votes_frame).copy()
+
+    @staticmethod
+    def _new_vote(category, candidate, voter_name, metadata=None, timestamp=None, rank=None):
         new_vote = {
             "category": category,
             "candidate": candidate,
-            "timestamp": datetime.now().isoformat(),
-            "voter": voter_name 
+            "timestamp": timestamp or datetime.now().isoformat(),
+            "voter": voter_name
         }
         if metadata:
             new_vote["metadata"] = metadata
-            
-        data["votes"].append(new_vote)
-        self._write_all(data)
+        if rank:
+            new_vote["rank"] = rank
+        return new_vote
+
+    def save_vote(self, category, candidate, voter_name, metadata=None, rank=None):
+        self.storage.append_votes([self._new_vote(category, candidate, voter_name, metadata, rank=rank)])
         return True
 
-    def clear_votes(self):
-        """Clears all votes but preserves settings"""
-        data = self._read_all()
-        data["votes"] = []
-        self._write_all(data)
+    def save_ballot(self, voter_name, choices, metadata=None):
+        """Save a whole ballot ({category: candidate}) in one write.
+
+        For a ranked category the choice is a list of candidates, best first;
+        each is stored as its own vote with its "rank".
+
+        The one-ballot-per-voter check happens in the same transaction as the write.
+        Returns False (and writes nothing) if the voter has already voted.
+        """
+        return self.save_ballot_async(voter_name, choices, metadata).result()
+
+    def save_ballot_async(self, voter_name, choices, metadata=None):
+        """Queue a ballot for the next group commit and return a Future for save_ballot's result.
+
+        The Future resolves once the ballot is durably stored (or refused).
+        """
+        timestamp = datetime.now().isoformat()
+        votes = []
+        for category, choice in choices.items():
+            if isinstance(choice, (list, tuple)):
+                votes.extend(
+                    self._new_vote(category, candidate, voter_name, metadata, timestamp, rank)
+                    for rank, candidate in enumerate(choice, start=1)
+                )
+            else:
+                votes.append(self._new_vote(category, choice, voter_name, metadata, timestamp))
+        return write_behind.writer_for(self.storage).submit(voter_name, votes)
+
+    def update_voter_metadata(self, voter_name, updates):
+        """Merge fields (e.g. a late-resolved IP) into the metadata of a voter's votes."""
+        self.storage.update_metadata(voter_name, updates)
         return True
 
-    def delete_votes_for_voter(self, voter_name: str) -> int:
-        """Delete ALL votes cast by a specific voter. Returns the number of deleted votes."""
-        data = self._read_all()
-        votes = data.get("votes", [])
-        if not votes:
-            return 0
+    def clear_votes(self, event=None, methods=None, candidates=None):
+        """Clears all votes but preserves settings.
 
-        remaining = [v for v in votes if v.get("voter") != voter_name]
-        deleted_count = len(votes) - len(remaining)
-        
-        data["votes"] = remaining
-        self._write_all(data)
+        The final results (get_results(methods, candidates)) are saved to the history
+        first (see history.record), under event or, by default, the data file's name.
+        """
+        self.flush()
+        event = event or os.path.splitext(os.path.basename(self.file_path.rstrip("/\\")))[0]
+        # Recorded under the wipe's write lock, so a ballot can't land in between and be lost
+        self.storage.clear_votes(
+            before=lambda: history.record(event, self.get_results(methods, candidates), len(self.list_voters()))
+        )
+        return True
 
-        return deleted_count
+    def delete_votes_for_voter(self, voter_name: str) -> int:
+        """Delete ALL votes cast by a specific voter. Returns the number of deleted votes."""
+        return self.storage.delete_voter(voter_name)
 
     def get_settings(self):
         """Get application settings"""
-        return self._read_all().get("settings", {"results_locked": False})
+        return self.storage.get_settings()
 
     def update_settings(self, new_settings):
         """Update application settings"""
-        data = self._read_all()
-        data["settings"] = new_settings
-        self._write_all(data)
+        self.storage.set_settings(new_settings)
         return True
 
     def list_voters(self):
         """Return sorted unique voter names that have cast at least one vote."""
-        votes = self.load_votes()
-        voters = sorted({v.get("voter") for v in votes if v.get("voter")})
-        return voters
+        return self.storage.list_voters()
 
     def get_candidates(self, category):
         """Get unique list of candidates already voted for in a category for autocomplete"""
-        votes = self.load_votes()
-        candidates = set()
-        for vote in votes:
-            if vote["category"] == category:
-                candidates.add(vote["candidate"])
-        return sorted(list(candidates))
+        return self.storage.candidates(category)
 
-    def get_results_df(self):
-        votes = self.load_votes()
-        if not votes:
-            return pd.DataFrame(columns=["Category", "Candidate", "Count"])
-        
-        df = pd.DataFrame(votes)
-        # Group by category and candidate to get counts
-        results = df.groupby(["category", "candidate"]).size().reset_index(name="count")
-        results.columns = ["Category", "Candidate", "Count"]
+    def get_tallies(self):
+        """Vote counts as {category: {candidate: count}}, without touching pandas."""
+        return self.storage.tallies()
+
+    def get_versioned_tallies(self):
+        """(data version, get_tallies()) read together: the tallies are exactly those of that version.
+
+        Shared between callers: don't modify the dicts.
+        """
+        key = (self.storage.key, "versioned_tallies")
+        version = self.storage.version()
+        with _memo_lock:
+            cached = _memo.get(key)
+        hit = cached is not None and cached[0] == version
+        instrumentation.record_cache("DataManager.versioned_tallies", hit)
+        if hit:
+            return cached
+        cached = self.storage.versioned_tallies()
+        with _memo_lock:
+            _memo[key] = cached
+        return cached
+
+    def get_tally(self, category):
+        """Vote counts for one category as {candidate: count}. Ranked ballots count their first choice."""
+        return self.storage.tally(category)
+
+    def get_ranked_ballots(self, category):
+        """{(first choice, second, ...): number of voters} for a category."""
+        return self._cached("ranked_ballots", lambda: self.storage.ranked_ballots(category), (category,))
+
+    def get_ranked_result(self, category, method="irv", candidates=None):
+        """The category counted with ranked.METHODS[method]; see ranked.tally. Shared: don't modify it."""
+        candidates = tuple(candidates) if candidates is not None else None
+        return self._cached(
+            "ranked",
+            lambda: ranked.tally(method, self.get_ranked_ballots(category), candidates),
+            (method, category, candidates),
+        )
+
+    def get_results(self, methods=None, candidates=None):
+        """Final standings as {category: {"method", "winners", "scores", "voters"}}.
+
+        methods maps ranked categories to their ranked.METHODS key (Election.ranked).
+        Those are counted over candidates like the live races, and their scores are
+        ranked.standings() in the method's units. Every other category's scores are
+        its plain tally. An archived store answers with the results frozen into it.
+        """
+        frozen = self.storage.frozen_results()
+        if frozen is not None:
+            return frozen
+        methods = methods or {}
+        results = {}
+        for category, tally in self.get_tallies().items():
+            method = methods.get(category)
+            if method:
+                outcome = self.get_ranked_result(category, method, candidates)
+                winners = outcome["winners"]
+                scores = {c: score for c, score in ranked.standings(outcome).items() if score or c in winners}
+                voters = sum(self.get_ranked_ballots(category).values())
+            else:
+                best = max(tally.values())
+                winners = sorted(c for c, count in tally.items() if count == best)
+                scores, voters = tally, sum(tally.values())
+            results[category] = {"method": method, "winners": winners, "scores": scores, "voters": voters}
         return results
 
+    def _build_results_df(self):
+        rows = sorted(
+            (category, candidate, count)
+            for category, candidates in self.storage.tallies().items()
+            for candidate, count in candidates.items()
+        )
+        # Same ordering the old groupby produced
+        return pd.DataFrame(rows, columns=["Category", "Candidate", "Count"])
+
+    def get_results_df(self):
+        return self._cached("results_df", self._build_results_df).copy()
+
     def has_voted(self, voter_name):
         """Check if a voter has already cast any votes"""
-        votes = self.load_votes()
-        for vote in votes:
-            if vote.get("voter") == voter_name:
-                return True
-        return False
+        return self.storage.has_voted(voter_name)
+
+    def _build_voter_stats(self):
+        columns = ["Voter", "Votes Cast", "Last Voted", "Device Info", "IP Address"]
+
+        stats = self.storage.voter_summaries()
+        if stats.empty:
+            return pd.DataFrame(columns=columns)
+
+        metas = [meta or {} for meta in stats["metadata"]]
+        df = pd.DataFrame({
+            "Voter": stats["voter"],
+            "Votes Cast": stats["votes"],
+            # One vectorised pass formats every voter's latest timestamp
+            "Last Voted": np.datetime_as_string(stats["last"].to_numpy(), unit="m"),
+            "Device Info": [meta.get("user_agent", "Unknown") for meta in metas],
+            "IP Address": [meta.get("ip", "Unknown") for meta in metas],
+        }, columns=columns)
+        df["Last Voted"] = df["Last Voted"].str.replace("T", " ", regex=False)
+        # Newest first, voters in name order within a minute
+        df = df.sort_values("Voter", kind="stable").sort_values("Last Voted", ascending=False, kind="stable")
+        return df.reset_index(drop=True)
 
     def get_voter_stats(self):
         """Get stats on who has voted including device fingerprints"""
-        votes = self.load_votes()
-        if not votes:
-            return pd.DataFrame(columns=["Voter", "Votes Cast", "Last Voted", "Device Info", "IP Address"])
-        
-        df = pd.DataFrame(votes)
-        if "voter" not in df.columns:
-             return pd.DataFrame(columns=["Voter", "Votes Cast", "Last Voted", "Device Info", "IP Address"])
-             
-        # Helper to extract metadata fields
-        def get_meta(voter_name, field):
-            voter_votes = [v for v in votes if v.get("voter") == voter_name and "metadata" in v]
-            if not voter_votes:
-                return "Unknown"
-            # Get from most recent vote
-            latest = sorted(voter_votes, key=lambda x: x['timestamp'], reverse=True)[0]
-            return latest["metadata"].get(field, "Unknown")
-
-        # Group by voter
-        stats = df.groupby("voter").agg({
-            "category": "count",
-            "timestamp": "max"
-        }).reset_index()
-        
-        stats.columns = ["Voter", "Votes Cast", "Last Voted"]
-        
-        # Add metadata columns
-        stats["Device Info"] = stats["Voter"].apply(lambda x: get_meta(x, "user_agent"))
-        stats["IP Address"] = stats["Voter"].apply(lambda x: get_meta(x, "ip"))
-        
-        # Format timestamp for better readability
-        stats["Last Voted"] = pd.to_datetime(stats["Last Voted"]).dt.strftime('%Y-%m-%d %H:%M')
-        
-        return stats.sort_values("Last Voted", ascending=False)
+        return self._cached("voter_stats", self._build_voter_stats).copy()
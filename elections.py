@@ -0,0 +1,180 @@
+"""Elections (events) hosted by one deployment.
+
+Each election has its own categories, roster, settings and vote store, so the
+yearly ROTY and a side event never mix votes. Categories are single-choice unless
+the election's "ranked" map gives them a ranked.METHODS method, and "badges" sets
+who gets which emoji (roster.DEFAULT_BADGES if it's missing). elections.json
+lists them and names the active one. Without that file there is a single "roty"
+election with the classic categories, utils.RANELADS and DATA_FILE, exactly as before.
+
+Stores are only opened when an election is actually used. archive() freezes a
+finished election into a read-only gzip snapshot (storage.ArchiveStorage), which
+costs nothing until somebody looks at it.
+"""
+import json
+import os
+import re
+import threading
+import ranked as ranked_methods
+import roster as roster_registry
+import storage
+import utils
+from data_manager import DATA_FILE, DataManager
+
+ELECTIONS_FILE = os.environ.get("ROTY_ELECTIONS_FILE", "elections.json")
+ARCHIVE_DIR = "archive"
+
+DEFAULT_ELECTION = "roty"
+# IDs end up in file names (votes-<id>.json, archive/<id>.json.gz), so they're kept to slugs
+ELECTION_ID = re.compile(r"[A-Za-z0-9][A-Za-z0-9_-]*")
+DEFAULT_CATEGORIES = ["Ranelad of the Year", "Worst Ranelad of the Year", "Most Improved Ranelad"]
+
+_lock = threading.Lock()
+_loaded = {}  # registry path -> (file signature, active id, {id: Election})
+
+
+class Election:
+    """One event: what can be voted on, who is on the ballot, and where its votes live."""
+
+    def __init__(self, election_id, title=None, categories=None, roster=None, data_file=None, archived=False,
+                 ranked=None, badges=None):
+        self.id = election_id
+        self.title = title or election_id
+        self.categories = list(DEFAULT_CATEGORIES if categories is None else categories)
+        self.roster = list(utils.RANELADS if roster is None else roster)
+        self.data_file = data_file or f"votes-{election_id}.json"
+        self.archived = archived
+        self.ranked = dict(ranked or {})  # category -> ranked.METHODS key
+        self.badges = dict(roster_registry.DEFAULT_BADGES if badges is None else badges)  # badge -> names
+
+    @classmethod
+    def from_dict(cls, election_id, data):
+        return cls(election_id, data.get("title"), data.get("categories"), data.get("roster"),
+                   data.get("data_file"), data.get("archived", False), data.get("ranked"), data.get("badges"))
+
+    def to_dict(self):
+        return {
+            "title": self.title,
+            "categories": self.categories,
+            "roster": self.roster,
+            "data_file": self.data_file,
+            "archived": self.archived,
+            "ranked": self.ranked,
+            "badges": self.badges,
+        }
+
+    def names(self):
+        """The roster.Registry for this election's line-up and badges."""
+        return roster_registry.registry(self.roster, self.badges)
+
+    def method(self, category):
+        """The ranked.METHODS key a category is counted with, or None for a single-choice category."""
+        return self.ranked.get(category)
+
+    def data_manager(self):
+        """The election's DataManager. Cheap: storages are opened once per process."""
+        return DataManager(self.data_file)
+
+
+def _default():
+    return DEFAULT_ELECTION, {DEFAULT_ELECTION: Election(DEFAULT_ELECTION, "Ranelad of the Year", data_file=DATA_FILE)}
+
+
+def _load(path):
+    """(active id, {id: Election}), re-read only when the registry file changes."""
+    sig = storage._file_signature(path)
+    with _lock:
+        cached = _loaded.get(path)
+        if cached and cached[0] == sig:
+            return cached[1], dict(cached[2])
+    if sig is None:
+        active_id, found = _default()
+    else:
+        with open(path) as f:
+            data = json.load(f)
+        found = {eid: Election.from_dict(eid, e) for eid, e in data.get("elections", {}).items()}
+        active_id = data.get("active")
+    with _lock:
+        _loaded[path] = (sig, active_id, found)
+    return active_id, dict(found)
+
+
+def _save(active_id, found, path):
+    storage._replace_json(path, {
+        "active": active_id,
+        "elections": {eid: election.to_dict() for eid, election in found.items()},
+    })
+
+
+def all_elections(path=ELECTIONS_FILE):
+    return list(_load(path)[1].values())
+
+
+def get(election_id, path=ELECTIONS_FILE):
+    found = _load(path)[1]
+    if election_id not in found:
+        raise KeyError(f"No election called {election_id!r}")
+    return found[election_id]
+
+
+def active(path=ELECTIONS_FILE):
+    active_id, found = _load(path)
+    return found[active_id]
+
+
+def create(election_id, title=None, categories=None, roster=None, data_file=None, activate=False,
+           ranked=None, badges=None, path=ELECTIONS_FILE):
+    """Registers a new election. Returns it.
+
+    categories and roster default to DEFAULT_CATEGORIES and utils.RANELADS when
+    left out (None); an empty list is an error. ranked maps categories to a
+    ranked.METHODS key; the others are single-choice. badges is {badge: [names]},
+    roster.DEFAULT_BADGES by default.
+    """
+    if not election_id:
+        raise ValueError("An election needs an ID")
+    if not ELECTION_ID.fullmatch(election_id):
+        raise ValueError(f"Election ID {election_id!r} must start with a letter or digit and "
+                         "only use letters, digits, '-' and '_'")
+    if categories is not None and not categories:
+        raise ValueError("An election needs at least one category")
+    if roster is not None and not roster:
+        raise ValueError("An election needs at least one name on the roster")
+    active_id, found = _load(path)
+    if election_id in found:
+        raise ValueError(f"Election {election_id!r} already exists")
+    unknown = set((ranked or {}).values()).difference(ranked_methods.METHODS)
+    if unknown:
+        raise ValueError(f"Unknown ranked-choice method(s): {', '.join(sorted(unknown))}")
+    election = found[election_id] = Election(election_id, title, categories, roster, data_file,
+                                             ranked=ranked, badges=badges)
+    _save(election_id if activate else active_id, found, path)
+    return election
+
+
+def set_active(election_id, path=ELECTIONS_FILE):
+    _, found = _load(path)
+    if found[election_id].archived:
+        raise ValueError(f"Election {election_id!r} is archived")
+    _save(election_id, found, path)
+
+
+def archive(election_id, path=ELECTIONS_FILE):
+    """Freezes an election into a read-only snapshot under ARCHIVE_DIR and points it there.
+
+    The active election can't be archived. The old store is left on disk untouched.
+    """
+    active_id, found = _load(path)
+    election = found[election_id]
+    if election_id == active_id:
+        raise ValueError("The active election can't be archived")
+    if election.archived:
+        return election
+    target = os.path.join(ARCHIVE_DIR, f"{election_id}{storage.ARCHIVE_EXTENSION}")
+    dm = election.data_manager()
+    dm.flush()
+    storage.write_archive(dm.storage, target, dm.get_results(election.ranked, election.roster))
+    found[election_id] = Election(election_id, election.title, election.categories, election.roster,
+                                  target, archived=True, ranked=election.ranked, badges=election.badges)
+    _save(active_id, found, path)
+    return found[election_id]
@@ -0,0 +1,80 @@
+"""Chunked exports of the detailed vote log.
+
+Rows are read from storage a chunk at a time, so the vote dicts never all sit
+in memory at once, and an export only costs anything when somebody actually
+downloads it. The finished file is handed over in memory: Streamlit reads the
+whole download into memory anyway.
+"""
+import csv
+import io
+import utils
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+COLUMNS = ["Voter", "Category", "Nominee", "Time"]
+CHUNK_SIZE = 5000
+
+
+def display_row(vote):
+    """One vote as a (Voter, Category, Nominee, Time) row for the log.
+
+    A preference on a ranked ballot shows its rank after the nominee, e.g. "Hugo (#2)".
+    """
+    timestamp = vote.get("timestamp")
+    nominee = utils.decorate_name(vote.get("candidate", "Unknown"))
+    if vote.get("rank"):
+        nominee = f"{nominee} (#{vote['rank']})"
+    return (
+        utils.decorate_name(vote.get("voter", "Unknown")),
+        vote.get("category", "Unknown"),
+        nominee,
+        # Timestamps are naive isoformat() strings, so '%H:%M:%S' is just a slice
+        timestamp[11:19] if timestamp else "Unknown",
+    )
+
+
+def iter_rows(dm, chunk_size=CHUNK_SIZE):
+    """Yields lists of display rows, chunk_size votes at a time."""
+    for votes in dm.iter_votes(chunk_size):
+        yield [display_row(v) for v in votes]
+
+
+def iter_csv(dm, chunk_size=CHUNK_SIZE):
+    """Yields the vote log as UTF-8 CSV, one encoded chunk at a time (header first)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(COLUMNS)
+    for rows in iter_rows(dm, chunk_size):
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def csv_bytes(dm):
+    """The whole vote log as UTF-8 CSV bytes, ready for st.download_button."""
+    return b"".join(iter_csv(dm))
+
+
+def parquet_available():
+    return pq is not None
+
+
+def parquet_file(dm):
+    """The whole vote log as Parquet (one row group per chunk) in a rewound BytesIO."""
+    if pq is None:
+        raise RuntimeError("Parquet export needs pyarrow installed")
+    schema = pa.schema([(name, pa.string()) for name in COLUMNS])
+    f = io.BytesIO()
+    with pq.ParquetWriter(f, schema) as writer:
+        for rows in iter_rows(dm):
+            columns = list(zip(*rows))
+            writer.write_table(pa.table([pa.array(c, pa.string()) for c in columns], schema=schema))
+    f.seek(0)
+    return f
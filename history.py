@@ -0,0 +1,163 @@
+"""Results history: what every wiped election looked like, and year-over-year stats.
+
+DataManager.clear_votes() calls record() first, which writes one immutable,
+gzip'd results file per event to RESULTS_DIR. Each file only holds aggregates:
+per-category standings with ranks and shares already worked out. A ranked
+category is recorded as its method counted it (its "method" says which), not
+by first choices. The query functions below read those aggregates, never raw
+votes, so the Hall of Fame stays instant however many ballots past events had.
+"""
+import gzip
+import json
+import os
+import re
+import threading
+from datetime import datetime
+import pandas as pd
+import ranked
+
+RESULTS_DIR = os.environ.get("ROTY_RESULTS_DIR", "results")
+RESULTS_EXTENSION = ".results.json.gz"
+PODIUM = 3
+
+_lock = threading.Lock()
+_loaded = {}  # results dir -> (listing signature, [event, ...])
+
+
+def _ranking(tally, total=None):
+    """[(candidate, votes, rank, share)], best first. Ties share a rank (1, 2, 2, 4).
+
+    Shares are of total, by default the sum of the tally.
+    """
+    total = sum(tally.values()) if total is None else total
+    ordered = sorted(tally.items(), key=lambda item: (-item[1], item[0]))
+    ranking = []
+    for position, (candidate, votes) in enumerate(ordered, start=1):
+        rank = ranking[-1][2] if ranking and ranking[-1][1] == votes else position
+        ranking.append((candidate, votes, rank, votes / total if total else 0.0))
+    return ranking
+
+
+def _unit(result):
+    """What a category's scores count: "votes", or ranked.UNITS' "points"/"wins"."""
+    return ranked.UNITS.get(result.get("method"), "votes")
+
+
+def _category_summary(result):
+    # Scores in votes are shares of the voters; points and wins are shares of the total
+    unit = _unit(result)
+    return {
+        "method": result["method"],
+        "votes": result["voters"],
+        "ranking": _ranking(result["scores"], result["voters"] if unit == "votes" else None),
+    }
+
+
+def record(event, results, voters, results_dir=RESULTS_DIR):
+    """Writes the final results of an event. Returns the file path, or None if there were no votes.
+
+    results is DataManager.get_results() and voters the number of people who voted.
+    """
+    if not any(result["scores"] for result in results.values()):
+        return None
+    now = datetime.now()
+    summary = {
+        "event": event,
+        "recorded_at": now.isoformat(),
+        "voters": voters,
+        "categories": {category: _category_summary(result) for category, result in results.items()},
+    }
+    os.makedirs(results_dir, exist_ok=True)
+    slug = re.sub(r"[^a-z0-9]+", "-", event.lower()).strip("-") or "event"
+    path = os.path.join(results_dir, f"{slug}-{now:%Y%m%d-%H%M%S-%f}{RESULTS_EXTENSION}")
+    # "x": never overwrite an existing result; read-only afterwards
+    with open(path, "xb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+            f.write(json.dumps(summary).encode("utf-8"))
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.chmod(path, 0o444)
+    return path
+
+
+def events(results_dir=RESULTS_DIR):
+    """Every recorded event's summary, oldest first. Re-read only when files come or go."""
+    try:
+        names = sorted(n for n in os.listdir(results_dir) if n.endswith(RESULTS_EXTENSION))
+    except FileNotFoundError:
+        return []
+    signature = tuple(names)
+    with _lock:
+        cached = _loaded.get(results_dir)
+        if cached and cached[0] == signature:
+            return cached[1]
+    found = []
+    for name in names:
+        with gzip.open(os.path.join(results_dir, name), "rb") as f:
+            found.append(json.loads(f.read()))
+    found.sort(key=lambda e: e["recorded_at"])
+    with _lock:
+        _loaded[results_dir] = (signature, found)
+    return found
+
+
+def _label(event):
+    return f"{event['event']} ({event['recorded_at'][:10]})"
+
+
+def winners(category=None, results_dir=RESULTS_DIR):
+    """One row per event and category with the winner(s), their score (in "Unit") and share.
+
+    "Method" says how the category was counted: single choice, or a ranked.METHODS method.
+    """
+    rows = [
+        {"Event": _label(event), "Category": name, "Method": ranked.METHODS.get(result.get("method"), "Single choice"),
+         "Winner": candidate, "Score": votes, "Unit": _unit(result), "Share": share}
+        for event in events(results_dir)
+        for name, result in event["categories"].items() if category in (None, name)
+        for candidate, votes, rank, share in result["ranking"] if rank == 1
+    ]
+    return pd.DataFrame(rows, columns=["Event", "Category", "Method", "Winner", "Score", "Unit", "Share"])
+
+
+def hall_of_fame(category=None, results_dir=RESULTS_DIR):
+    """Per nominee: wins, podium finishes, events they got votes in and total votes. Best first.
+
+    Points and wins from Borda or Condorcet categories don't add to the votes.
+    """
+    stats = {}
+    for event in events(results_dir):
+        for name, result in event["categories"].items():
+            if category not in (None, name):
+                continue
+            for candidate, votes, rank, _ in result["ranking"]:
+                entry = stats.setdefault(candidate, [0, 0, set(), 0])
+                entry[0] += rank == 1
+                entry[1] += rank <= PODIUM
+                entry[2].add(event["recorded_at"])
+                entry[3] += votes if _unit(result) == "votes" else 0
+    rows = [
+        {"Nominee": candidate, "Wins": wins, "Podiums": podiums, "Events": len(seen), "Votes": votes}
+        for candidate, (wins, podiums, seen, votes) in stats.items()
+    ]
+    df = pd.DataFrame(rows, columns=["Nominee", "Wins", "Podiums", "Events", "Votes"])
+    return df.sort_values(["Wins", "Podiums", "Votes", "Nominee"], ascending=[False, False, False, True])
+
+
+def vote_share_trend(category, results_dir=RESULTS_DIR):
+    """Long-form (Event, Nominee, Share) rows for one category across events, oldest first."""
+    rows = [
+        {"Event": _label(event), "Nominee": candidate, "Share": share}
+        for event in events(results_dir) if category in event["categories"]
+        for candidate, _, _, share in event["categories"][category]["ranking"]
+    ]
+    return pd.DataFrame(rows, columns=["Event", "Nominee", "Share"])
+
+
+def categories(results_dir=RESULTS_DIR):
+    """Every category that appears in the history, in first-seen order."""
+    seen = {}
+    for event in events(results_dir):
+        for name in event["categories"]:
+            seen.setdefault(name, None)
+    return list(seen)
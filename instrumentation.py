@@ -0,0 +1,155 @@
+"""Opt-in hot-path instrumentation.
+
+Records call counts and cumulative time for instrumented functions, bytes
+read/written by the storage layer, and cache hit rates. Everything is a no-op
+until enable() is called (or ROTY_METRICS=1 is set), so the cost when off is a
+single flag check per call. Results can be dumped as JSON or Prometheus text.
+"""
+import functools
+import json
+import os
+import threading
+import time
+
+_enabled = os.environ.get("ROTY_METRICS", "").lower() in ("1", "true", "yes")
+_lock = threading.Lock()
+_calls = {}       # name -> [count, total seconds, max seconds]
+_bytes = {}       # name -> [read, written]
+_caches = {}      # name -> [hits, misses]
+_lru_caches = {}  # name -> functools.lru_cache function, read at snapshot time
+_lru_base = {}    # lru_cache function -> cache_info() at the last reset
+
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _calls.clear()
+        _bytes.clear()
+        _caches.clear()
+    for fn in _lru_caches.values():
+        _lru_base[fn] = fn.cache_info()
+
+
+def timed(name):
+    """Decorator counting calls to, and time spent in, the wrapped function."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with _lock:
+                    entry = _calls.setdefault(name, [0, 0.0, 0.0])
+                    entry[0] += 1
+                    entry[1] += elapsed
+                    entry[2] = max(entry[2], elapsed)
+        return wrapper
+    return decorator
+
+
+def instrument_public_methods(prefix):
+    """Class decorator applying timed() to every public method, named "<prefix>.<method>"."""
+    def decorator(cls):
+        for attr, value in list(vars(cls).items()):
+            if not attr.startswith("_") and callable(value):
+                setattr(cls, attr, timed(f"{prefix}.{attr}")(value))
+        return cls
+    return decorator
+
+
+def add_bytes(name, read=0, written=0):
+    if not _enabled:
+        return
+    with _lock:
+        entry = _bytes.setdefault(name, [0, 0])
+        entry[0] += read
+        entry[1] += written
+
+
+def record_cache(name, hit):
+    if not _enabled:
+        return
+    with _lock:
+        entry = _caches.setdefault(name, [0, 0])
+        entry[0 if hit else 1] += 1
+
+
+def register_lru_cache(name, fn):
+    """Reports a functools.lru_cache's own hit/miss counters under name."""
+    _lru_caches[name] = fn
+    _lru_base.setdefault(fn, fn.cache_info())
+
+
+def snapshot():
+    """All metrics as plain dicts: calls, bytes and caches, each keyed by name."""
+    with _lock:
+        calls = {
+            name: {"count": count, "total_seconds": total, "max_seconds": worst,
+                   "mean_seconds": total / count if count else 0.0}
+            for name, (count, total, worst) in _calls.items()
+        }
+        io = {name: {"read": read, "written": written} for name, (read, written) in _bytes.items()}
+        caches = {name: [hits, misses] for name, (hits, misses) in _caches.items()}
+
+    for name, fn in _lru_caches.items():
+        info, base = fn.cache_info(), _lru_base[fn]
+        caches[name] = [info.hits - base.hits, info.misses - base.misses]
+
+    return {
+        "enabled": _enabled,
+        "calls": calls,
+        "bytes": io,
+        "caches": {
+            name: {"hits": hits, "misses": misses,
+                   "hit_rate": hits / (hits + misses) if hits + misses else 0.0}
+            for name, (hits, misses) in caches.items()
+        },
+    }
+
+
+def to_json():
+    return json.dumps(snapshot(), indent=2, sort_keys=True)
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def to_prometheus():
+    """Metrics in the Prometheus text exposition format."""
+    snap = snapshot()
+    families = [
+        ("roty_calls_total", "counter", "Calls to an instrumented function.",
+         "name", [(n, c["count"]) for n, c in snap["calls"].items()]),
+        ("roty_call_seconds_total", "counter", "Cumulative seconds spent in an instrumented function.",
+         "name", [(n, c["total_seconds"]) for n, c in snap["calls"].items()]),
+        ("roty_call_seconds_max", "gauge", "Slowest single call to an instrumented function.",
+         "name", [(n, c["max_seconds"]) for n, c in snap["calls"].items()]),
+        ("roty_bytes_read_total", "counter", "Bytes read from storage.",
+         "name", [(n, b["read"]) for n, b in snap["bytes"].items()]),
+        ("roty_bytes_written_total", "counter", "Bytes written to storage.",
+         "name", [(n, b["written"]) for n, b in snap["bytes"].items()]),
+        ("roty_cache_hits_total", "counter", "Cache hits.",
+         "cache", [(n, c["hits"]) for n, c in snap["caches"].items()]),
+        ("roty_cache_misses_total", "counter", "Cache misses.",
+         "cache", [(n, c["misses"]) for n, c in snap["caches"].items()]),
+    ]
+    lines = []
+    for metric, kind, help_text, label, samples in families:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for name, value in sorted(samples):
+            lines.append(f'{metric}{{{label}="{_label(name)}"}} {value}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,40 @@
+"""Copies votes and settings from one storage file to another.
+
+Usage:
+    python migrate_votes.py votes.json votes.db      # JSON -> SQLite
+    python migrate_votes.py votes.db votes.json      # and back again
+
+The backend for each side is picked from the file extension, as in DataManager.
+The target must not already hold votes.
+"""
+import argparse
+from storage import open_storage
+
+
+def migrate(source_path, target_path):
+    source = open_storage(source_path)
+    target = open_storage(target_path)
+
+    if target.load_votes():
+        raise SystemExit(f"❌ {target_path} already has votes; refusing to merge into it.")
+
+    votes = source.load_votes()
+    if votes:
+        target.append_votes(votes)
+    target.set_settings(source.get_settings())
+    target.flush()
+    return len(votes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source")
+    parser.add_argument("target")
+    args = parser.parse_args()
+
+    count = migrate(args.source, args.target)
+    print(f"✅ Copied {count} votes from {args.source} to {args.target}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Background public-IP lookup for voter metadata.
+
+When Streamlit only sees a private or unknown address (LAN-hosted events,
+local testing) we ask api.ipify.org for the public one. That call must never
+block a ballot, so it runs on a daemon thread and its answer is cached
+per-process for CACHE_TTL seconds. Failures are cached for FAILURE_TTL so an
+offline network doesn't spawn a lookup for every voter.
+"""
+import threading
+import time
+import requests
+
+LOOKUP_URL = "https://api.ipify.org"
+LOOKUP_TIMEOUT = 2
+CACHE_TTL = 600
+FAILURE_TTL = 60
+
+_lock = threading.Lock()
+_cached_ip = None
+_expires_at = 0.0
+_worker = None
+_callbacks = []
+
+
+def needs_lookup(ip):
+    """True for addresses that say nothing useful about where the voter is."""
+    return ip == "Unknown" or ip.startswith("127.") or ip.startswith("192.168.")
+
+
+def cached():
+    """The last resolved public IP if it is still fresh, otherwise None. Never blocks."""
+    with _lock:
+        if time.monotonic() < _expires_at:
+            return _cached_ip
+    return None
+
+
+def resolve_in_background(callback=None):
+    """Looks up the public IP on a daemon thread and calls callback(ip) once it's known.
+
+    Uses the cache when fresh, and joins a lookup that is already running rather
+    than starting another. callback is not called if the lookup fails.
+    """
+    global _worker
+    with _lock:
+        fresh = time.monotonic() < _expires_at
+        if not fresh:
+            if callback:
+                _callbacks.append(callback)
+            if _worker is None:
+                _worker = threading.Thread(target=_lookup, name="public-ip-lookup", daemon=True)
+                _worker.start()
+            return
+        ip = _cached_ip
+    if callback and ip:
+        callback(ip)
+
+
+def _lookup():
+    global _cached_ip, _expires_at, _worker
+    try:
+        ip = requests.get(LOOKUP_URL, timeout=LOOKUP_TIMEOUT).text.strip() or None
+    except requests.RequestException:
+        ip = None
+
+    with _lock:
+        _cached_ip = ip
+        _expires_at = time.monotonic() + (CACHE_TTL if ip else FAILURE_TTL)
+        callbacks = list(_callbacks)
+        _callbacks.clear()
+        _worker = None
+
+    if ip:
+        for callback in callbacks:
+            try:
+                callback(ip)
+            except Exception:
+                # Enrichment is best effort; one failed update mustn't starve the rest
+                pass
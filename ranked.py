@@ -0,0 +1,170 @@
+"""Ranked-choice tallies: instant runoff, Borda count and Condorcet.
+
+A ranked category stores one vote per preference, with "rank" 1 for the first
+choice, so the ordinary tallies of a ranked category are its first preferences.
+Storage.ranked_ballots() folds the votes back into {(first, second, ...): voters};
+identical ballots are counted once, which keeps 100k ballots over a couple of
+dozen nominees down to a few thousand distinct rankings.
+
+Every method returns a dict with "method", "winners" (more than one on a tie)
+and "rounds", a list of {candidate: score} dicts in order. Borda and Condorcet
+have one round; instant runoff has one per elimination, which is what
+utils.render_horse_race_html animates.
+"""
+from collections import Counter
+
+METHODS = {
+    "irv": "Instant runoff",
+    "borda": "Borda count",
+    "condorcet": "Condorcet",
+}
+UNITS = {"irv": "votes", "borda": "points", "condorcet": "wins"}
+
+
+def count_ballots(rankings):
+    """Iterable of rankings (sequences of candidates, best first) -> {ranking tuple: count}."""
+    return Counter(tuple(ranking) for ranking in rankings if ranking)
+
+
+def _candidates(ballots):
+    return sorted({candidate for ballot in ballots for candidate in ballot})
+
+
+def _top(scores):
+    best = max(scores.values(), default=0)
+    return sorted(candidate for candidate, score in scores.items() if score == best) if scores else []
+
+
+def instant_runoff(ballots):
+    """Instant runoff over {ranking: count}.
+
+    Each round the candidates with the fewest votes are dropped together and only
+    their ballots move on to the next continuing preference, so a ballot is looked
+    at again only when its current choice goes out, never once per round.
+    Ballots with no continuing preference left are counted in "exhausted".
+    """
+    piles = {candidate: [] for candidate in _candidates(ballots)}  # candidate -> [[ballot, count, position]]
+    counts = dict.fromkeys(piles, 0)
+    for ballot, count in ballots.items():
+        piles[ballot[0]].append([ballot, count, 0])
+        counts[ballot[0]] += count
+
+    rounds, eliminated, exhausted = [], [], 0
+    while counts:
+        rounds.append(dict(counts))
+        leader = max(counts.values())
+        lowest = min(counts.values())
+        if leader * 2 > sum(counts.values()) or leader == lowest:
+            break
+        out = [candidate for candidate, votes in counts.items() if votes == lowest]
+        eliminated.append(out)
+        moving = []
+        for candidate in out:
+            del counts[candidate]
+            moving.extend(piles.pop(candidate))
+        for entry in moving:
+            ballot, count, position = entry
+            position += 1
+            while position < len(ballot) and ballot[position] not in counts:
+                position += 1
+            if position == len(ballot):
+                exhausted += count
+                continue
+            entry[2] = position
+            piles[ballot[position]].append(entry)
+            counts[ballot[position]] += count
+
+    return {
+        "method": "irv",
+        "winners": _top(rounds[-1]) if rounds else [],
+        "rounds": rounds,
+        "eliminated": eliminated,
+        "exhausted": exhausted,
+    }
+
+
+def borda(ballots, candidates=None):
+    """Borda count: with n candidates, a first choice scores n - 1, a second n - 2, and so on.
+
+    candidates is the full line-up (by default everybody ranked on some ballot),
+    so a short ballot leaves the candidates it doesn't mention on 0.
+    """
+    candidates = list(candidates) if candidates is not None else _candidates(ballots)
+    top_score = len(candidates) - 1
+    points = dict.fromkeys(candidates, 0)
+    for ballot, count in ballots.items():
+        for position, candidate in enumerate(ballot):
+            points[candidate] = points.get(candidate, 0) + max(top_score - position, 0) * count
+    return {"method": "borda", "winners": _top(points), "rounds": [points]}
+
+
+def condorcet(ballots, candidates=None):
+    """Head-to-head comparison of every pair of candidates.
+
+    A ballot prefers each candidate it ranks to every one ranked later or not at
+    all. The Condorcet winner beats everybody else; if there is none, the
+    candidates with the most head-to-head wins (Copeland) win. The single round
+    holds each candidate's number of head-to-head wins.
+    """
+    # "Ranks a but not b" is (ballots ranking a) - (ballots ranking both), so each
+    # ballot only costs O(its length squared), however long the line-up is
+    mentions, above, both = {}, {}, {}
+    for ballot, count in ballots.items():
+        for position, a in enumerate(ballot):
+            mentions[a] = mentions.get(a, 0) + count
+            a_above, a_both = above.setdefault(a, {}), both.setdefault(a, {})
+            for b in ballot[position + 1:]:
+                a_above[b] = a_above.get(b, 0) + count
+                a_both[b] = a_both.get(b, 0) + count
+                b_both = both.setdefault(b, {})
+                b_both[a] = b_both.get(a, 0) + count
+    names = list(candidates if candidates is not None else _candidates(ballots))
+    names += sorted(set(mentions).difference(names))
+    # preferred[a][b]: voters preferring a to b
+    preferred = {
+        a: {
+            b: above.get(a, {}).get(b, 0) + mentions.get(a, 0) - both.get(a, {}).get(b, 0)
+            for b in names if b != a
+        }
+        for a in names
+    }
+    wins = dict.fromkeys(names, 0)
+    for i, a in enumerate(names):
+        for b in names[i + 1:]:
+            a_over_b, b_over_a = preferred[a].get(b, 0), preferred[b].get(a, 0)
+            if a_over_b > b_over_a:
+                wins[a] += 1
+            elif b_over_a > a_over_b:
+                wins[b] += 1
+    beats_all = [a for a in names if wins[a] == len(names) - 1]
+    return {
+        "method": "condorcet",
+        "winners": beats_all or _top(wins),
+        "condorcet_winner": bool(beats_all),
+        "rounds": [wins],
+        "pairwise": preferred,
+    }
+
+
+def standings(result):
+    """{candidate: score} for everybody in a tally() result; sorting by score gives the finishing order.
+
+    Borda and Condorcet have a single round. In an instant runoff each candidate
+    keeps their votes from the last round they were still in: a candidate only
+    goes out with fewer votes than everyone left, so later exits outrank earlier ones.
+    """
+    scores = {}
+    for round_scores in result["rounds"]:
+        scores.update(round_scores)
+    return scores
+
+
+def tally(method, ballots, candidates=None):
+    """Runs METHODS[method] over {ranking: count}."""
+    if method == "irv":
+        return instant_runoff(ballots)
+    if method == "borda":
+        return borda(ballots, candidates)
+    if method == "condorcet":
+        return condorcet(ballots, candidates)
+    raise ValueError(f"Unknown ranked-choice method {method!r}")
@@ -0,0 +1,107 @@
+"""Who's who: canonical names, badges and display names for the people on a roster.
+
+Names arrive decorated or not ("David 👑" from the roster, "David" typed
+somewhere else), so every name has a canonical id (badges stripped) and a
+display name (canonical id plus its badge, if it has one). A Registry works
+both out once per distinct name; after that, display() and canonical() are
+dict lookups, cheap enough to run per row, per vote and per horse on every tick.
+
+Badges are configured per election ({badge: [canonical names]}, the "badges"
+entry in elections.json), DEFAULT_BADGES otherwise.
+"""
+import threading
+
+DEFAULT_BADGES = {
+    "👑": ["David", "Rob", "Kill", "Jack", "Simo"],  # former winners, Hall of Famers
+    "💩💩": ["Con"],
+}
+
+_lock = threading.Lock()
+_registries = {}  # (names, badges) -> Registry
+_current = None
+
+
+class Registry:
+    """Precomputed canonical ids and display names for a roster under one set of badge rules."""
+
+    def __init__(self, names=(), badges=None):
+        badges = DEFAULT_BADGES if badges is None else badges
+        self.badges = {badge: list(holders) for badge, holders in badges.items()}
+        self._badge_of = {holder: badge for badge, holders in self.badges.items() for holder in holders}
+        self._suffixes = [f" {badge}" for badge in self.badges]
+        self._canonical = {}
+        self._display = {}
+        for name in names:
+            self._learn(name)
+
+    def _learn(self, name):
+        """Works out name's canonical id and display name. The only slow path."""
+        clean = name
+        for suffix in self._suffixes:
+            clean = clean.replace(suffix, "")
+        clean = clean.strip()
+        badge = self._badge_of.get(clean)
+        # A name without a badge of its own is shown exactly as given
+        self._canonical[name] = clean
+        self._display[name] = f"{clean} {badge}" if badge else name
+
+    def display(self, name):
+        """name with its badge, e.g. "David" -> "David 👑"."""
+        if not name:
+            return name
+        try:
+            return self._display[name]
+        except KeyError:
+            self._learn(name)
+            return self._display[name]
+
+    def canonical(self, name):
+        """name without any badge, e.g. "David 👑" -> "David"."""
+        if not name:
+            return name
+        try:
+            return self._canonical[name]
+        except KeyError:
+            self._learn(name)
+            return self._canonical[name]
+
+    def badge(self, name):
+        """name's badge, or None."""
+        return self._badge_of.get(self.canonical(name))
+
+
+def registry(names=(), badges=None):
+    """The shared Registry for a roster and badge rules, built once per process."""
+    badges = DEFAULT_BADGES if badges is None else badges
+    key = (tuple(names), tuple((badge, tuple(holders)) for badge, holders in badges.items()))
+    with _lock:
+        found = _registries.get(key)
+        if found is None:
+            found = _registries[key] = Registry(names, badges)
+        return found
+
+
+def use(names):
+    """Makes the Registry names the one current() (and so utils.decorate_name) uses. Returns it."""
+    global _current
+    _current = names
+    return names
+
+
+def current():
+    """The registry last passed to use(), normally the active election's; DEFAULT_BADGES until then."""
+    return _current or use(registry())
+
+
+def parse_badges(text):
+    """'👑: David, Rob' lines -> {badge: [names]}; the inverse of format_badges."""
+    badges = {}
+    for line in text.splitlines():
+        badge, _, holders = line.partition(":")
+        if badge.strip() and holders.strip():
+            badges[badge.strip()] = [h.strip() for h in holders.split(",") if h.strip()]
+    return badges
+
+
+def format_badges(badges):
+    return "\n".join(f"{badge}: {', '.join(holders)}" for badge, holders in badges.items())
@@ -1,23 +1,33 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import statistics
+import tempfile
 import time
 import random
+from concurrent.futures import ThreadPoolExecutor
 from data_manager import DataManager
-import utils
+import benchmark
+import elections
+from utils import DEVICES
 
 def simulate_voting_session():
-    dm = DataManager()
+    election = elections.active()
+    dm = election.data_manager()
     
     print("🚀 Starting Vote Simulation...")
     print("--------------------------------")
 
     # List of categories
-    categories = ["Ranelad of the Year", "Worst Ranelad of the Year", "Most Improved Ranelad"]
+    categories = election.categories
     
     # Selection of potential voters (using the real list)
-    voters = utils.RANELADS.copy()
+    voters = list(election.roster)
     random.shuffle(voters)
     
     # Simulated devices and IPs
-    devices = ["iPhone", "Android Phone", "iPad", "Mac Desktop", "Windows Desktop"]
+    devices = DEVICES
     
     # We'll simulate 10 people voting
     num_simulated_voters = min(10, len(voters))
@@ -25,9 +35,6 @@ def simulate_voting_session():
     for i in range(num_simulated_voters):
         voter = voters[i]
         
-        # Clean the name for logic (remove emojis if present)
-        voter_base = voter.replace(" 👑", "").replace(" 💩💩", "").strip()
-        
         print(f"👤 {voter} is entering the booth...")
         
         # Simulated metadata
@@ -38,12 +45,18 @@ def simulate_voting_session():
         }
         
         # Pick random candidates (but not themselves)
-        candidates = [r for r in utils.RANELADS if r != voter]
+        candidates = [r for r in election.roster if r != voter]
         
         for category in categories:
-            choice = random.choice(candidates)
-            dm.save_vote(category, choice, voter, metadata=metadata)
-            print(f"   ✅ Voted for {choice} in '{category}'")
+            if election.method(category):
+                ranking = random.sample(candidates, min(3, len(candidates)))
+                for rank, choice in enumerate(ranking, start=1):
+                    dm.save_vote(category, choice, voter, metadata=metadata, rank=rank)
+                print(f"   ✅ Ranked {', '.join(ranking)} in '{category}'")
+            else:
+                choice = random.choice(candidates)
+                dm.save_vote(category, choice, voter, metadata=metadata)
+                print(f"   ✅ Voted for {choice} in '{category}'")
             
             # Small realistic delay between category selections
             time.sleep(random.uniform(0.5, 1.5))
@@ -59,6 +72,109 @@ def simulate_voting_session():
     print("--------------------------------")
     print("✅ Simulation Complete! Check your Live Leaderboard and Voter Log.")
 
+def _cast_ballots(file_path, voter_ids, threads, api):
+    """Benchmark worker: casts a ballot for each voter id.
+
+    Returns (per-call latencies in seconds, votes refused because the voter had already voted).
+    """
+    dm = DataManager(file_path)
+    election = elections.active()
+
+    def cast(i):
+        rng = random.Random(i)
+        voter = f"bench-voter-{i}"
+        metadata = {
+            "ip": f"192.168.{i // 250 % 256}.{i % 250 + 2}",
+            "user_agent": rng.choice(DEVICES),
+            "raw_ua": "Simulated/1.0"
+        }
+        choices = {category: rng.choice(election.roster) for category in election.categories}
+        latencies, refused = [], 0
+        if api == "ballot":
+            start = time.perf_counter()
+            if not dm.save_ballot(voter, choices, metadata=metadata):
+                refused = len(choices)
+            latencies.append(time.perf_counter() - start)
+        else:
+            for category, choice in choices.items():
+                start = time.perf_counter()
+                dm.save_vote(category, choice, voter, metadata=metadata)
+                latencies.append(time.perf_counter() - start)
+        return latencies, refused
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(cast, voter_ids))
+    return [latency for batch, _ in results for latency in batch], sum(refused for _, refused in results)
+
+def _store_size(file_path):
+    """Bytes on disk for a store, including its journal / WAL side files (or shard directory)."""
+    if os.path.isdir(file_path):
+        return sum(_store_size(os.path.join(file_path, name)) for name in os.listdir(file_path))
+    return sum(os.path.getsize(p) for p in glob.glob(file_path + "*") if not p.endswith(".lock"))
+
+def run_benchmark(voters, processes, threads, api="vote", backend="json", file_path=None, read_sizes=()):
+    """Casts `voters` ballots flat out from a process x thread pool and prints throughput and latency."""
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = file_path or os.path.join(tmp, benchmark.STORE_NAMES[backend])
+        dm = DataManager(file_path)
+        votes_before = len(dm.load_votes())
+
+        print(f"🏇 Benchmark: {voters} voters, {processes} processes x {threads} threads, {api} API, {file_path}")
+        chunks = [list(range(p, voters, processes)) for p in range(processes)]
+        start = time.perf_counter()
+        if processes == 1:
+            results = [_cast_ballots(file_path, chunks[0], threads, api)]
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                results = pool.starmap(_cast_ballots, [(file_path, chunk, threads, api) for chunk in chunks])
+        latencies = [latency for batch, _ in results for latency in batch]
+        refused = sum(refused for _, refused in results)
+        elapsed = time.perf_counter() - start
+
+        # Ballots refused because the store already had those voters were never meant to land
+        expected = voters * len(elections.active().categories) - refused
+        lost = votes_before + expected - len(dm.load_votes())
+
+        print(f"   {expected} votes in {elapsed:.2f}s -> {expected / elapsed:.0f} votes/s")
+        if latencies:
+            p50, p95, p99 = (statistics.quantiles(latencies, n=100)[i] for i in (49, 94, 98)) if len(latencies) > 1 else latencies * 3
+            print(f"   {api} latency: p50 {p50 * 1000:.2f} ms | p95 {p95 * 1000:.2f} ms | p99 {p99 * 1000:.2f} ms")
+        if refused:
+            print(f"   Refused votes (voter already voted): {refused}")
+        print(f"   Lost votes: {lost} | Store size: {_store_size(file_path) / 1024:.1f} KiB")
+
+    for size in read_sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            dm = benchmark.seeded_store(tmp, size, backend)
+            timings = []
+            for name in ("get_results_df", "get_voter_stats"):
+                read = getattr(dm, name)
+                cold = benchmark.timed(read, repeat=1)
+                warm = benchmark.timed(read)
+                timings.append(f"{name} cold {cold * 1000:.1f} ms / warm {warm * 1000:.2f} ms")
+            print(f"   📖 {size} votes: " + " | ".join(timings))
+
+    return lost
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate voters against the vote store.")
+    parser.add_argument("--bench", action="store_true", help="no delays: measure throughput and latency instead")
+    parser.add_argument("--voters", type=int, default=1000, help="simulated voters in --bench mode")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=8, help="threads per process")
+    parser.add_argument("--api", choices=["vote", "ballot"], default="vote", help="save_vote per category or one save_ballot")
+    parser.add_argument("--backend", choices=sorted(benchmark.STORE_NAMES), default="json")
+    parser.add_argument("--file", help="store to write to (default: a throwaway temp file)")
+    parser.add_argument("--read-sizes", type=int, nargs="*", default=[1_000, 10_000, 100_000],
+                        help="vote counts to time the read paths at")
+    args = parser.parse_args()
+
+    if not args.bench:
+        simulate_voting_session()
+        return
+    lost = run_benchmark(args.voters, args.processes, args.threads, args.api, args.backend, args.file, args.read_sizes)
+    raise SystemExit(1 if lost else 0)
+
 if __name__ == "__main__":
-    simulate_voting_session()
+    main()
 
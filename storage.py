@@ -0,0 +1,1575 @@
+"""Storage backends behind DataManager.
+
+JsonStorage keeps the original votes.json snapshot plus an append-only journal
+and suits small deployments. SqliteStorage keeps votes in an indexed SQLite
+table (WAL mode) for bigger events. ShardedStorage splits the JSON layout into
+one file per category, and ArchiveStorage serves a finished election from a
+read-only gzip snapshot. open_storage() picks one by file extension.
+"""
+import atexit
+import bisect
+import gzip
+import hashlib
+import heapq
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from itertools import islice
+import instrumentation
+import ranked
+from columnar import VoteColumns
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+DEFAULT_SETTINGS = {"results_locked": False}
+
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+# A "<name>.shards" directory holds one JSON shard per category (ShardedStorage)
+SHARDED_EXTENSION = ".shards"
+SHARD_MANIFEST = "manifest.json"
+SHARD_VOTERS = "voters.json"
+SHARD_BALLOT = "ballot"
+
+# Archived elections are frozen into gzip'd JSON (ArchiveStorage, read-only)
+ARCHIVE_EXTENSION = ".json.gz"
+
+# Votes are appended to "<file>.journal" (one JSON line each) and folded back
+# into the snapshot in the background once the journal grows past COMPACT_BYTES
+# and COMPACT_RATIO of the snapshot's size, so rewrites get rarer as the file grows.
+# A journal starts with a {"op": "journal", "id": ...} header; the snapshot notes
+# the id and byte offset it has folded up to, so a crash between writing the
+# snapshot and emptying the journal doesn't count those votes twice.
+JOURNAL_SUFFIX = ".journal"
+COMPACT_BYTES = 256 * 1024
+COMPACT_RATIO = 0.5
+
+# Deleting a voter only writes a tombstone; the backend compacts on a background
+# thread COMPACT_DELAY seconds later, so a burst of deletes shares one compaction.
+# The in-memory index drops its deleted rows (an O(votes) rebuild, under its lock)
+# only once they are PURGE_RATIO of its rows; until then reads just skip them.
+COMPACT_DELAY = 1.0
+PURGE_RATIO = 0.1
+
+# Appends are fsync'd in batches: every FSYNC_EVERY records or FSYNC_INTERVAL
+# seconds, whichever comes first. Pending records are synced on exit.
+FSYNC_EVERY = 16
+FSYNC_INTERVAL = 1.0
+
+# Vote metadata (ip, user agent) is stored once per distinct device, keyed by
+# device_fingerprint(); votes only carry the fingerprint.
+FINGERPRINT_LENGTH = 16
+
+# changes_since() can replay up to CHANGE_LOG_SIZE recent vote changes; callers
+# that are further behind than that get None and reload in full.
+CHANGE_LOG_SIZE = 10000
+
+# Writers hold an exclusive flock on "<file>.lock"; readers take a shared
+# one only when the files changed since they last looked.
+LOCK_SUFFIX = ".lock"
+
+
+_stores = {}  # (backend, absolute path) -> storage, one per file per process
+_stores_lock = threading.RLock()  # re-entrant: a ShardedStorage opens its shards through open_storage
+
+
+def open_storage(file_path, backend=None):
+    """Returns the storage for file_path. backend is "json", "sqlite", "sharded" or
+    "archive"; by default it is inferred from the extension (.db/.sqlite/.sqlite3
+    mean SQLite, .shards a directory of per-category shards, .json.gz an archive).
+
+    Each file's storage (and its migration check) is created once per process;
+    later calls get the same object back.
+    """
+    if backend is None:
+        if file_path.lower().endswith(SQLITE_EXTENSIONS):
+            backend = "sqlite"
+        elif file_path.rstrip("/\\").lower().endswith(SHARDED_EXTENSION):
+            backend = "sharded"
+        elif file_path.lower().endswith(ARCHIVE_EXTENSION):
+            backend = "archive"
+        else:
+            backend = "json"
+    backends = {"json": JsonStorage, "sqlite": SqliteStorage, "sharded": ShardedStorage, "archive": ArchiveStorage}
+    if backend not in backends:
+        raise ValueError(f"Unknown storage backend: {backend!r}")
+    key = (backend, os.path.abspath(file_path))
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = backends[backend](file_path)
+        return store
+
+
+def device_fingerprint(metadata):
+    """Stable short hash of a metadata dict, used as its key in the device table."""
+    canonical = json.dumps(metadata, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(canonical).hexdigest()[:FINGERPRINT_LENGTH]
+
+
+class Storage:
+    """Where votes and settings live.
+
+    Votes are plain dicts with category, candidate, timestamp, voter and an
+    optional metadata dict. Backends store each distinct metadata dict once and
+    join it back onto the votes they return. A vote on a ranked ballot also has
+    a "rank" (1 for the first choice); tallies only count first choices.
+    version() changes whenever the stored data does, so callers can cache
+    anything derived from it.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.key = (type(self).__name__, os.path.abspath(file_path))
+
+    def load_votes(self):
+        raise NotImplementedError
+
+    def count_votes(self):
+        return len(self.load_votes())
+
+    def votes_page(self, offset, limit):
+        """Votes offset..offset+limit in insertion order."""
+        return self.load_votes()[offset:offset + limit]
+
+    def iter_votes(self, chunk_size=1000):
+        """Yields all votes in insertion order, chunk_size at a time."""
+        votes = self.load_votes()
+        for start in range(0, len(votes), chunk_size):
+            yield votes[start:start + chunk_size]
+
+    def votes_frame(self):
+        """Every vote's category, candidate, voter and timestamp as a DataFrame."""
+        columns = VoteColumns()
+        for chunk in self.iter_votes():
+            for vote in chunk:
+                columns.append(vote)
+        return columns.to_frame()
+
+    def append_votes(self, votes):
+        raise NotImplementedError
+
+    def add_ballot(self, voter_name, votes):
+        """Stores votes unless voter_name has already voted, atomically. Returns whether it stored them."""
+        return self.add_ballots([(voter_name, votes)])[0]
+
+    def add_ballots(self, ballots):
+        """Group commit of (voter_name, votes) ballots with add_ballot's one-per-voter rule.
+
+        Durable on return. Returns one bool per ballot; a voter appearing twice only
+        gets their first ballot stored.
+        """
+        raise NotImplementedError
+
+    def clear_votes(self, before=None):
+        """Wipes every vote, keeping the settings.
+
+        before(), when given, runs first under the same write lock, so no vote can be
+        stored between it and the wipe (DataManager records the final results there).
+        """
+        raise NotImplementedError
+
+    def delete_voter(self, voter_name):
+        """Removes every vote by voter_name and returns how many there were."""
+        raise NotImplementedError
+
+    def update_metadata(self, voter_name, updates):
+        """Merges updates into the metadata of every vote by voter_name."""
+        raise NotImplementedError
+
+    def get_settings(self):
+        raise NotImplementedError
+
+    def set_settings(self, settings):
+        raise NotImplementedError
+
+    def has_voted(self, voter_name):
+        raise NotImplementedError
+
+    def list_voters(self):
+        raise NotImplementedError
+
+    def candidates(self, category):
+        """Every candidate voted for in category, at any rank on a ranked ballot, sorted."""
+        raise NotImplementedError
+
+    def tallies(self):
+        """Vote counts as {category: {candidate: count}}."""
+        raise NotImplementedError
+
+    def tally(self, category):
+        return self.tallies().get(category, {})
+
+    def versioned_tallies(self):
+        """(version(), tallies()) read together, so the tallies are exactly that version's."""
+        # Backends that can't read both at once retry until nothing moved in between
+        while True:
+            version = self.version()
+            tallies = self.tallies()
+            if self.version() == version:
+                return version, tallies
+
+    def ranked_ballots(self, category):
+        """{(first choice, second, ...): number of voters} for category, as ranked.count_ballots.
+
+        A plain vote is a one-choice ballot, so any category can be counted as ranked.
+        """
+        rankings = {}
+        for vote in self.load_votes():
+            if vote.get("category") == category:
+                rankings.setdefault(vote.get("voter"), []).append((vote.get("rank") or 1, vote["candidate"]))
+        return dict(ranked.count_ballots(
+            [candidate for _, candidate in sorted(choices)] for choices in rankings.values()
+        ))
+
+    def voter_summaries(self):
+        """DataFrame with a row per voter: voter, votes (categories voted in; a ranked ballot
+        counts once), last (datetime64 of their latest vote) and metadata (of their latest
+        vote that has any, else None).
+        The first vote wins when timestamps tie."""
+        columns = VoteColumns()
+        for vote in self.load_votes():
+            columns.append(vote)
+        return columns.voter_summaries()
+
+    def version(self):
+        raise NotImplementedError
+
+    def changes_since(self, version):
+        """(current version, [(op, vote), ...]) for the votes added ("add") or removed
+        ("delete") after version, oldest first.
+
+        The list is None when the changes can't be replayed (too old, a wipe, or a
+        backend without a change log): reload everything instead. Versions that
+        only changed settings or metadata give an empty list.
+        """
+        current = self.version()
+        return current, [] if current == version else None
+
+    def frozen_results(self):
+        """DataManager.get_results() as frozen into the store by write_archive(), or None for a live store."""
+        return None
+
+    def compact(self):
+        """Backend housekeeping; a no-op unless the backend needs it."""
+
+    def flush(self):
+        """Forces buffered writes to disk; a no-op unless the backend buffers."""
+
+
+# --- JSON snapshot + journal ---------------------------------------------------
+
+_pending_sync = {}  # journal path -> [unsynced record count, last sync time]
+_compactions = {}  # storage key -> pid of the process with a background compaction due
+_compactions_lock = threading.Lock()
+
+
+def _sync_pending():
+    for path, state in list(_pending_sync.items()):
+        if state[0] and os.path.exists(path):
+            with open(path, "a") as f:
+                os.fsync(f.fileno())
+            state[0] = 0
+
+atexit.register(_sync_pending)
+
+
+def _compact_soon(storage):
+    """Runs storage.compact() on a daemon thread in COMPACT_DELAY seconds, unless one is already due."""
+    with _compactions_lock:
+        if _compactions.get(storage.key) == os.getpid():
+            return
+        _compactions[storage.key] = os.getpid()
+
+    def run():
+        # Cleared before compacting, so deletes that land meanwhile schedule another one
+        with _compactions_lock:
+            _compactions.pop(storage.key, None)
+        storage.compact()
+
+    timer = threading.Timer(COMPACT_DELAY, run)
+    timer.daemon = True
+    timer.start()
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _parse_journal(chunk):
+    """Returns (records, bytes consumed). A torn final line (no newline yet) is left for later."""
+    end = chunk.rfind(b"\n") + 1
+    return [json.loads(line) for line in chunk[:end].splitlines() if line.strip()], end
+
+
+def _journal_id(first_line):
+    """The id in a journal's header line; None for a journal from before headers."""
+    if first_line.endswith(b"\n"):
+        record = json.loads(first_line)
+        if record.get("op") == "journal":
+            return record["id"]
+    return None
+
+
+def _journal_header():
+    """A new journal's first line. The id is fresh, so no snapshot's "journal" entry matches it by accident."""
+    return (json.dumps({"op": "journal", "id": os.urandom(8).hex()}) + "\n").encode("utf-8")
+
+
+def _split_devices(votes):
+    """Votes with their metadata swapped for a "device" fingerprint, plus {fingerprint: metadata}."""
+    stored, devices = [], {}
+    for vote in votes:
+        metadata = vote.get("metadata")
+        vote = {k: v for k, v in vote.items() if k != "metadata"}
+        if metadata:
+            fingerprint = device_fingerprint(metadata)
+            devices[fingerprint] = metadata
+            vote["device"] = fingerprint
+        stored.append(vote)
+    return stored, devices
+
+
+def _join_devices(votes, devices):
+    """Inverse of _split_devices. Votes that still carry inline metadata pass through."""
+    joined = []
+    for vote in votes:
+        if "device" in vote:
+            vote = dict(vote)
+            metadata = devices.get(vote.pop("device"))
+            if metadata:
+                vote["metadata"] = metadata
+        joined.append(vote)
+    return joined
+
+
+def _votes_record(op, votes):
+    """A self-contained "vote"/"ballot" journal record carrying the devices it references."""
+    stored, devices = _split_devices(votes)
+    record = {"op": op, "vote": stored[0]} if op == "vote" else {"op": op, "votes": stored}
+    if devices:
+        record["devices"] = devices
+    return record
+
+
+def _record_votes(record):
+    """Votes carried by one journal record: a single "vote" or a whole "ballot"."""
+    if record.get("op") == "vote":
+        votes = [record["vote"]]
+    elif record.get("op") == "ballot":
+        votes = record["votes"]
+    else:
+        return []
+    return _join_devices(votes, record.get("devices", {}))
+
+
+def _first_choice(vote):
+    """Whether a vote counts in the plain tallies: not ranked, or ranked first."""
+    return (vote.get("rank") or 1) == 1
+
+
+def _recount(counts, vote, step):
+    """Adds step to vote's candidate in {category: {candidate: count}}, dropping what reaches zero."""
+    candidates = counts.setdefault(vote.get("category"), {})
+    candidates[vote.get("candidate")] = candidates.get(vote.get("candidate"), 0) + step
+    if not candidates[vote.get("candidate")]:
+        del candidates[vote.get("candidate")]
+        if not candidates:
+            del counts[vote.get("category")]
+
+
+def _write_temp(path, write, mode="w"):
+    """Calls write(f) on a temp file next to path, fsyncs it and gives it path's permissions. Returns its name."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path
+
+
+def _snapshot_temp(path, data):
+    """data as a snapshot in a temp file next to path (see _write_temp)."""
+    def write(f):
+        json.dump(data, f, indent=4)
+        instrumentation.add_bytes("json.snapshot", written=f.tell())
+    return _write_temp(path, write)
+
+
+def _replace_json(path, data):
+    """Writes data to a temp file next to path, fsyncs it, then os.replace()s it into place."""
+    tmp_path = _snapshot_temp(path, data)
+    try:
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class _VoteIndex:
+    """Process-wide in-memory view of one votes file.
+
+    Shared by every JsonStorage pointing at the same path. It is rebuilt when
+    the snapshot's mtime/size changes, and only the new tail of the journal is
+    parsed when the journal grows, so most reads are dict lookups. The votes
+    themselves are kept in compact VoteColumns rather than as dicts.
+    """
+
+    def __init__(self, lock_path):
+        self.lock = threading.RLock()
+        self.compacting = threading.Lock()  # one compaction at a time in this process
+        self.lock_path = lock_path
+        self._lock_fd = None
+        self._lock_pid = None
+        self._lock_depth = 0
+        self.snapshot_sig = None
+        self.journal_offset = 0
+        self.version = 0
+        self.reset({})
+
+    def reset(self, data):
+        self.version += 1
+        self.columns = VoteColumns()
+        self.by_voter = {}  # voter -> row numbers in self.columns
+        self.tallies = {}
+        self.mentions = {}  # like tallies, but counting every rank: who has been voted for at all
+        self.settings = data.get("settings", dict(DEFAULT_SETTINGS))
+        for vote in data.get("votes", []):
+            self.add(vote, log=False)
+        # Nothing before a reset can be replayed
+        self.changes = []  # (version, op, vote), oldest first
+        self.changes_floor = self.version
+
+    def log_change(self, op, vote):
+        self.changes.append((self.version, op, vote))
+        if len(self.changes) > 2 * CHANGE_LOG_SIZE:
+            self.changes_floor = self.changes[-CHANGE_LOG_SIZE - 1][0]
+            del self.changes[:-CHANGE_LOG_SIZE]
+
+    def add(self, vote, log=True):
+        self.version += 1
+        if log:
+            self.log_change("add", vote)
+        row = self.columns.append(vote)
+        self.by_voter.setdefault(vote.get("voter"), []).append(row)
+        _recount(self.mentions, vote, 1)
+        if _first_choice(vote):
+            _recount(self.tallies, vote, 1)
+
+    def remove_voter(self, voter):
+        """Drops a voter's votes and subtracts them from the tallies. Returns how many were removed.
+
+        The rows are only flagged as deleted in self.columns; purge() drops them at compaction.
+        """
+        rows = self.by_voter.pop(voter, [])
+        if not rows:
+            return 0
+        self.version += 1
+        for row in rows:
+            vote = self.columns.vote(row)
+            self.log_change("delete", vote)
+            self.columns.delete(row)
+            _recount(self.mentions, vote, -1)
+            if _first_choice(vote):
+                _recount(self.tallies, vote, -1)
+        return len(rows)
+
+    def purge(self):
+        """Physically drops deleted rows once there are enough of them. Renumbers rows, so by_voter is rebuilt."""
+        if self.columns.deleted_count > PURGE_RATIO * len(self.columns.timestamp) and self.columns.purge():
+            self.by_voter = self.columns.rows_by_voter()
+
+    def apply(self, record):
+        if record.get("op") == "meta":
+            self.update_metadata(record["voter"], record["metadata"])
+        elif record.get("op") == "delete":
+            self.remove_voter(record["voter"])
+        for vote in _record_votes(record):
+            self.add(vote)
+
+    def update_metadata(self, voter, updates):
+        for row in self.by_voter.get(voter, []):
+            current = self.columns.vote(row).get("metadata", {})
+            self.columns.set_metadata(row, {**current, **updates})
+        self.version += 1
+
+    @contextmanager
+    def file_lock(self, exclusive=True):
+        """Inter-process flock on the votes file, re-entrant within the thread holding self.lock.
+
+        Always taken after self.lock, never before, so threads and processes agree on lock order.
+        """
+        with self.lock:
+            if self._lock_depth == 0 and fcntl is not None:
+                # A forked child must not reuse the parent's descriptor: flocks
+                # belong to the open file, so parent and child would share one.
+                if self._lock_pid != os.getpid():
+                    self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+                    self._lock_pid = os.getpid()
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and fcntl is not None:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def refresh(self, store):
+        sig = _file_signature(store.file_path)
+        journal_size = (_file_signature(store.journal_path) or (0, 0))[1]
+        unchanged = sig == self.snapshot_sig and journal_size == self.journal_offset
+        instrumentation.record_cache("json.index", unchanged)
+        if unchanged:
+            return
+        with self.file_lock(exclusive=False):
+            self._reload(store)
+
+    def _reload(self, store):
+        sig = _file_signature(store.file_path)
+        if sig != self.snapshot_sig:
+            data = store._read_snapshot()
+            self.reset(data)
+            self.snapshot_sig = sig
+            _, self.journal_offset = store._journal_start(data.get("journal"))
+
+        journal_size = (_file_signature(store.journal_path) or (0, 0))[1]
+        if journal_size < self.journal_offset:
+            # Compacted by another process: start over from the new snapshot
+            self.snapshot_sig = None
+            self._reload(store)
+        elif journal_size > self.journal_offset:
+            with open(store.journal_path, "rb") as f:
+                f.seek(self.journal_offset)
+                chunk = f.read()
+            instrumentation.add_bytes("json.journal", read=len(chunk))
+            records, consumed = _parse_journal(chunk)
+            for record in records:
+                self.apply(record)
+            self.journal_offset += consumed
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _index_for(file_path):
+    key = os.path.abspath(file_path)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = _VoteIndex(key + LOCK_SUFFIX)
+        return _indexes[key]
+
+
+class JsonStorage(Storage):
+    """votes.json snapshot plus an append-only journal, served from a shared in-memory index."""
+
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        self.journal_path = file_path + JOURNAL_SUFFIX
+        self._index = _index_for(file_path)
+        self._ensure_file_exists()
+
+    def _ensure_file_exists(self):
+        with self._locked():
+            if not os.path.exists(self.file_path):
+                initial_data = {
+                    "votes": [],
+                    "settings": dict(DEFAULT_SETTINGS)
+                }
+                _replace_json(self.file_path, initial_data)
+            else:
+                # Migration: Ensure settings key exists in existing file
+                data = self._read_all()
+                if "settings" not in data:
+                    data["settings"] = dict(DEFAULT_SETTINGS)
+                    self._write_all(data)
+
+    def _locked(self):
+        """Exclusive inter-process lock for read-modify-write sections."""
+        return self._index.file_lock(exclusive=True)
+
+    def _read_snapshot(self):
+        # Snapshots are only ever swapped in whole via os.replace, so a decode
+        # error means real corruption and is raised rather than read as "no votes".
+        try:
+            with open(self.file_path, "r") as f:
+                data = json.load(f)
+                instrumentation.add_bytes("json.snapshot", read=f.tell())
+        except FileNotFoundError:
+            return {"votes": [], "settings": dict(DEFAULT_SETTINGS)}
+        data["votes"] = _join_devices(data.get("votes", []), data.pop("devices", {}))
+        return data
+
+    def _journal_start(self, folded):
+        """(journal id, offset of the first record not yet in a snapshot that has folded up to folded)."""
+        try:
+            with open(self.journal_path, "rb") as f:
+                first_line = f.readline()
+        except FileNotFoundError:
+            return None, 0
+        journal_id = _journal_id(first_line)
+        if first_line and folded and folded.get("id") == journal_id:
+            return journal_id, folded["offset"]
+        return journal_id, 0
+
+    def _read_all(self):
+        """Snapshot plus any votes still sitting in the journal.
+
+        data["journal"] notes how far into the journal that goes, ready to be written back.
+        """
+        data = self._read_snapshot()
+        journal_id, start = self._journal_start(data.get("journal"))
+        try:
+            with open(self.journal_path, "rb") as f:
+                f.seek(start)
+                chunk = f.read()
+            instrumentation.add_bytes("json.journal", read=len(chunk))
+            records, consumed = _parse_journal(chunk)
+        except FileNotFoundError:
+            records, consumed = [], 0
+        votes = data.setdefault("votes", [])
+        for record in records:
+            if record.get("op") == "meta":
+                for vote in votes:
+                    if vote.get("voter") == record["voter"]:
+                        vote["metadata"] = {**vote.get("metadata", {}), **record["metadata"]}
+            elif record.get("op") == "delete":
+                votes[:] = [vote for vote in votes if vote.get("voter") != record["voter"]]
+            votes.extend(_record_votes(record))
+        data["journal"] = {"id": journal_id, "offset": start + consumed}
+        return data
+
+    def _write_all(self, data):
+        """Rewrites the snapshot. Everything in the journal is folded in, so it is emptied."""
+        with self._locked():
+            # Marked as holding the whole journal before it's emptied, in case we crash in between
+            journal_id, _ = self._journal_start(None)
+            folded = {"id": journal_id, "offset": (_file_signature(self.journal_path) or (0, 0))[1]}
+            votes, devices = _split_devices(data.get("votes", []))
+            _replace_json(self.file_path, {**data, "votes": votes, "devices": devices, "journal": folded})
+            if os.path.exists(self.journal_path):
+                os.truncate(self.journal_path, 0)
+            _pending_sync.pop(self.journal_path, None)
+            # We already hold the new contents, so hand them to the index directly
+            self._index.reset(data)
+            self._index.snapshot_sig = _file_signature(self.file_path)
+            self._index.journal_offset = 0
+
+    def _view(self):
+        """The shared index, brought up to date with the files on disk. Hold its lock while reading."""
+        with self._index.lock:
+            self._index.refresh(self)
+        return self._index
+
+    def _append_journal(self, records, sync=False):
+        """Appends records to the journal. sync=True fsyncs now instead of in the next batch."""
+        lines = "".join(json.dumps(r) + "\n" for r in records).encode("utf-8")
+        with self._locked():
+            with open(self.journal_path, "ab+") as f:
+                size = f.seek(0, os.SEEK_END)
+                if size:
+                    # Drop a torn line left by a crashed writer so ours starts cleanly
+                    f.seek(size - 1)
+                    if f.read(1) != b"\n":
+                        f.seek(0)
+                        size = f.read().rfind(b"\n") + 1
+                        f.truncate(size)
+                if not size:
+                    lines = _journal_header() + lines
+                f.write(lines)
+                f.flush()
+                instrumentation.add_bytes("json.journal", written=len(lines))
+                state = _pending_sync.setdefault(self.journal_path, [0, time.monotonic()])
+                state[0] += len(records)
+                if sync or state[0] >= FSYNC_EVERY or time.monotonic() - state[1] >= FSYNC_INTERVAL:
+                    os.fsync(f.fileno())
+                    state[0], state[1] = 0, time.monotonic()
+            snapshot_size = (self._index.snapshot_sig or (0, 0))[1]
+            if size + len(lines) >= max(COMPACT_BYTES, COMPACT_RATIO * snapshot_size):
+                _compact_soon(self)
+
+    def compact(self):
+        """Folds the journal into the snapshot file, dropping tombstoned votes for good.
+
+        The new snapshot is read and written without holding any lock, so reads
+        and appends carry on meanwhile; the locks are only taken to swap it in.
+        If the snapshot was rewritten in the meantime (a wipe, a settings change
+        or another process compacting first) the new one is thrown away.
+        """
+        with self._index.compacting:
+            sig = _file_signature(self.file_path)
+            data = self._read_all()
+            votes, devices = _split_devices(data["votes"])
+            tmp_path = _snapshot_temp(self.file_path, {**data, "votes": votes, "devices": devices})
+            try:
+                with self._locked():
+                    journal_id, _ = self._journal_start(None)
+                    if _file_signature(self.file_path) != sig or journal_id != data["journal"]["id"]:
+                        return
+                    index = self._view()
+                    os.replace(tmp_path, self.file_path)
+                    index.snapshot_sig = _file_signature(self.file_path)
+                    index.journal_offset = self._rotate_journal(data["journal"]["offset"], index.journal_offset)
+                    # The index already holds everything; at most it loses its deleted rows
+                    index.purge()
+            finally:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+
+    def _rotate_journal(self, folded, end):
+        """Replaces the journal with a fresh one holding only bytes folded:end of it. Returns its size.
+
+        Hold the lock. The new journal has a new id, so the snapshot that folded
+        the old one up to folded replays it from the start.
+        """
+        try:
+            with open(self.journal_path, "rb") as f:
+                f.seek(folded)
+                tail = f.read(end - folded)
+        except FileNotFoundError:
+            return 0
+        header = _journal_header()
+        os.replace(_write_temp(self.journal_path, lambda f: f.write(header + tail), "wb"), self.journal_path)
+        _pending_sync.pop(self.journal_path, None)
+        return len(header) + len(tail)
+
+    def flush(self):
+        _sync_pending()
+
+    def load_votes(self):
+        index = self._view()
+        with index.lock:
+            return index.columns.votes()
+
+    def count_votes(self):
+        index = self._view()
+        with index.lock:
+            return len(index.columns)
+
+    def votes_page(self, offset, limit):
+        index = self._view()
+        with index.lock:
+            return index.columns.votes(offset, offset + limit)
+
+    def votes_frame(self):
+        index = self._view()
+        with index.lock:
+            return index.columns.to_frame()
+
+    def iter_votes(self, chunk_size=1000):
+        # Copy one chunk at a time rather than the whole list up front
+        offset = 0
+        while True:
+            chunk = self.votes_page(offset, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+            offset += len(chunk)
+
+    def append_votes(self, votes):
+        self._append_journal([_votes_record("vote" if len(votes) == 1 else "ballot", votes)])
+
+    def add_ballots(self, ballots):
+        results, records, seen = [], [], set()
+        with self._locked():
+            index = self._view()
+            for voter_name, votes in ballots:
+                stored = voter_name not in index.by_voter and voter_name not in seen
+                if stored:
+                    seen.add(voter_name)
+                    records.append(_votes_record("ballot", votes))
+                results.append(stored)
+            if records:
+                self._append_journal(records, sync=True)
+        return results
+
+    def clear_votes(self, before=None):
+        # Nothing from the old files survives but the settings, which the index has
+        with self._locked():
+            if before:
+                before()
+            settings = self.get_settings()
+            self._write_all({"votes": [], "settings": settings})
+
+    def delete_voter(self, voter_name):
+        # A tombstone in the journal: the index (and so every tally) drops the
+        # votes straight away, and the snapshot is rewritten later in the background
+        with self._locked():
+            index = self._view()
+            deleted = len(index.by_voter.get(voter_name, []))
+            if not deleted:
+                return 0
+            self._append_journal([{"op": "delete", "voter": voter_name}], sync=True)
+        _compact_soon(self)
+        return deleted
+
+    def update_metadata(self, voter_name, updates):
+        self._append_journal([{"op": "meta", "voter": voter_name, "metadata": updates}])
+
+    def get_settings(self):
+        index = self._view()
+        with index.lock:
+            return dict(index.settings)
+
+    def set_settings(self, settings):
+        with self._locked():
+            data = self._read_all()
+            data["settings"] = settings
+            self._write_all(data)
+
+    def has_voted(self, voter_name):
+        index = self._view()
+        with index.lock:
+            return voter_name in index.by_voter
+
+    def list_voters(self):
+        index = self._view()
+        with index.lock:
+            return sorted(v for v in index.by_voter if v)
+
+    def candidates(self, category):
+        index = self._view()
+        with index.lock:
+            return sorted(index.mentions.get(category, {}))
+
+    def tallies(self):
+        index = self._view()
+        with index.lock:
+            return {category: dict(candidates) for category, candidates in index.tallies.items()}
+
+    def tally(self, category):
+        index = self._view()
+        with index.lock:
+            return dict(index.tallies.get(category, {}))
+
+    def versioned_tallies(self):
+        index = self._view()
+        with index.lock:
+            return index.version, {category: dict(candidates) for category, candidates in index.tallies.items()}
+
+    def ranked_ballots(self, category):
+        index = self._view()
+        with index.lock:
+            return index.columns.ranked_ballots(category)
+
+    def voter_summaries(self):
+        index = self._view()
+        with index.lock:
+            return index.columns.voter_summaries()
+
+    def version(self):
+        index = self._view()
+        with index.lock:
+            return index.version
+
+    def changes_since(self, version):
+        # Versions are this process's index counter, so the log lives in the index too
+        index = self._view()
+        with index.lock:
+            if version < index.changes_floor or version > index.version:
+                return index.version, None
+            start = bisect.bisect_right(index.changes, version, key=lambda change: change[0])
+            return index.version, [(op, vote) for _, op, vote in index.changes[start:]]
+
+
+# --- Sharded JSON --------------------------------------------------------------
+
+def _shard_name(category):
+    """File name for a category's shard: a readable slug plus a hash so names never collide."""
+    slug = re.sub(r"[^a-z0-9]+", "-", str(category).lower()).strip("-")[:40] or "category"
+    return f"{slug}-{hashlib.sha1(str(category).encode('utf-8')).hexdigest()[:8]}.json"
+
+
+class ShardedStorage(Storage):
+    """A directory holding one JsonStorage shard per category, plus a voter index.
+
+    Every shard has its own journal and lock, so writers to different categories
+    don't contend and reading one category's results only reads that shard. The
+    voter index (voters.json) records one entry per ballot; it enforces the
+    one-ballot rule and holds the settings. manifest.json maps categories to files.
+    """
+
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        os.makedirs(file_path, exist_ok=True)
+        self.manifest_path = os.path.join(file_path, SHARD_MANIFEST)
+        self._voters = open_storage(os.path.join(file_path, SHARD_VOTERS), "json")
+        self._manifest_lock = threading.Lock()
+        self._manifest_sig = None
+        self._manifest_loads = 0
+        self._categories = {}  # category -> JsonStorage
+
+    def _shards(self):
+        """{category: shard}, reloaded when another process has added a category."""
+        with self._manifest_lock:
+            sig = _file_signature(self.manifest_path)
+            if sig != self._manifest_sig:
+                try:
+                    with open(self.manifest_path) as f:
+                        manifest = json.load(f)
+                except FileNotFoundError:
+                    manifest = {}
+                self._categories = {
+                    category: open_storage(os.path.join(self.file_path, name), "json")
+                    for category, name in manifest.items()
+                }
+                self._manifest_sig = sig
+                self._manifest_loads += 1
+            return dict(self._categories)
+
+    def _shard(self, category, create=False):
+        shard = self._shards().get(category)
+        if shard is None and create:
+            # New categories are rare; the voter index's lock serialises manifest updates
+            with self._voters._locked():
+                shard = self._shards().get(category)
+                if shard is None:
+                    manifest = {c: os.path.basename(s.file_path) for c, s in self._shards().items()}
+                    manifest[category] = _shard_name(category)
+                    _replace_json(self.manifest_path, manifest)
+                    shard = self._shards()[category]
+        return shard
+
+    def _by_category(self, votes):
+        grouped = {}
+        for vote in votes:
+            grouped.setdefault(vote["category"], []).append(vote)
+        return grouped
+
+    def _merged_votes(self, chunk_size=10_000):
+        """Every shard's votes merged back by time, lazily: a chunk per shard in memory at once.
+
+        Shards only know their own order. load_votes, votes_page and iter_votes all
+        read this one merge, so they agree on the order.
+        """
+        streams = [
+            (vote for chunk in shard.iter_votes(chunk_size) for vote in chunk)
+            for shard in self._shards().values()
+        ]
+        return heapq.merge(*streams, key=lambda v: v["timestamp"])
+
+    def load_votes(self):
+        return list(self._merged_votes())
+
+    def votes_page(self, offset, limit):
+        # Skipping still walks the merge, but nothing is sorted or held beyond a chunk per shard
+        return list(islice(self._merged_votes(max(1, min(offset + limit, 10_000))), offset, offset + limit))
+
+    def iter_votes(self, chunk_size=1000):
+        merged = self._merged_votes()
+        while True:
+            chunk = list(islice(merged, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def count_votes(self):
+        return sum(shard.count_votes() for shard in self._shards().values())
+
+    def _register_voters(self, votes):
+        # Loose votes skip the one-ballot rule, so a racing duplicate entry is harmless
+        entries = [
+            _ballot_entry(voter_name) for voter_name in {vote.get("voter") for vote in votes}
+            if voter_name is not None and not self._voters.has_voted(voter_name)
+        ]
+        if entries:
+            self._voters.append_votes(entries)
+
+    def append_votes(self, votes):
+        for category, category_votes in self._by_category(votes).items():
+            self._shard(category, create=True).append_votes(category_votes)
+        self._register_voters(votes)
+
+    def add_ballots(self, ballots):
+        # Claim the voters first: a crash between shards can then only lose part of
+        # a ballot, never let somebody vote twice
+        with self._voters._locked():
+            results = self._voters.add_ballots(
+                [(voter_name, [_ballot_entry(voter_name)]) for voter_name, _ in ballots]
+            )
+            stored = [votes for (_, votes), ok in zip(ballots, results) if ok]
+            # Still under the voter index's lock, so clear_votes() never lands between the claim and the votes
+            for category, votes in self._by_category(v for votes in stored for v in votes).items():
+                shard = self._shard(category, create=True)
+                with shard._locked():
+                    shard._append_journal([_votes_record("ballot", votes)], sync=True)
+        return results
+
+    def clear_votes(self, before=None):
+        # The voter index's lock keeps new ballots (and shards) out; each shard's lock, loose votes
+        with self._voters._locked(), ExitStack() as stack:
+            shards = self._shards().values()
+            for shard in shards:
+                stack.enter_context(shard._locked())
+            if before:
+                before()
+            for shard in shards:
+                shard.clear_votes()
+            self._voters.clear_votes()
+
+    def delete_voter(self, voter_name):
+        with self._voters._locked():
+            deleted = sum(shard.delete_voter(voter_name) for shard in self._shards().values())
+            self._voters.delete_voter(voter_name)
+        return deleted
+
+    def update_metadata(self, voter_name, updates):
+        for shard in self._shards().values():
+            if shard.has_voted(voter_name):
+                shard.update_metadata(voter_name, updates)
+
+    def get_settings(self):
+        return self._voters.get_settings()
+
+    def set_settings(self, settings):
+        self._voters.set_settings(settings)
+
+    def has_voted(self, voter_name):
+        return self._voters.has_voted(voter_name)
+
+    def list_voters(self):
+        return self._voters.list_voters()
+
+    def candidates(self, category):
+        shard = self._shard(category)
+        return shard.candidates(category) if shard else []
+
+    def tallies(self):
+        results = {}
+        for shard in self._shards().values():
+            results.update(shard.tallies())
+        return results
+
+    def tally(self, category):
+        shard = self._shard(category)
+        return shard.tally(category) if shard else {}
+
+    def ranked_ballots(self, category):
+        shard = self._shard(category)
+        return shard.ranked_ballots(category) if shard else {}
+
+    def voter_summaries(self):
+        import pandas as pd
+
+        frames = [frame for frame in (shard.voter_summaries() for shard in self._shards().values()) if not frame.empty]
+        if len(frames) <= 1:
+            return frames[0] if frames else pd.DataFrame(columns=["voter", "votes", "last", "metadata"])
+        merged = pd.concat(frames, ignore_index=True)
+        stats = merged.groupby("voter", sort=False).agg(votes=("votes", "sum"), last=("last", "max"))
+        # Shards are in a fixed order, and idxmax() keeps the first one's metadata on a tie
+        with_meta = merged[merged["metadata"].notna()]
+        latest = with_meta.groupby("voter", sort=False)["last"].idxmax()
+        metas = dict(zip(latest.index, merged["metadata"].to_numpy()[latest.to_numpy()]))
+        return pd.DataFrame({
+            "voter": stats.index.to_numpy(dtype=object),
+            "votes": stats["votes"].to_numpy(),
+            "last": stats["last"].to_numpy(),
+            "metadata": [metas.get(voter) for voter in stats.index],
+        })
+
+    def version(self):
+        shards = self._shards()
+        with self._manifest_lock:
+            loads = self._manifest_loads
+        # Every part only ever counts up, so the sum moves whenever any of them does
+        return loads + self._voters.version() + sum(shard.version() for shard in shards.values())
+
+    def compact(self):
+        self._voters.compact()
+        for shard in self._shards().values():
+            shard.compact()
+
+    def flush(self):
+        _sync_pending()
+
+
+def _ballot_entry(voter_name):
+    """The voter index's record of one ballot."""
+    return {"category": SHARD_BALLOT, "candidate": "", "timestamp": datetime.now().isoformat(), "voter": voter_name}
+
+
+# --- Read-only archives --------------------------------------------------------
+
+def write_archive(source, target_path, results=None):
+    """Writes source's votes, settings and tallies to a gzip'd, read-only snapshot at target_path.
+
+    results (DataManager.get_results()) are frozen alongside when given, so ranked
+    categories keep the winners their method picked rather than the first choices.
+    """
+    votes, devices = _split_devices(source.load_votes())
+    data = {"votes": votes, "devices": devices, "settings": source.get_settings(), "tallies": source.tallies()}
+    if results is not None:
+        data["results"] = results
+    directory = os.path.dirname(os.path.abspath(target_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(target_path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                f.write(json.dumps(data).encode("utf-8"))
+            raw.flush()
+            os.fsync(raw.fileno())
+            instrumentation.add_bytes("archive", written=raw.tell())
+        os.replace(tmp_path, target_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class ArchiveStorage(Storage):
+    """A past election frozen by write_archive(): loaded on first read, never written.
+
+    Tallies were computed when it was archived, so results don't even need the votes.
+    """
+
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _load(self):
+        with self._lock:
+            if self._data is None:
+                with open(self.file_path, "rb") as raw:
+                    with gzip.GzipFile(fileobj=raw) as f:
+                        data = json.loads(f.read())
+                    instrumentation.add_bytes("archive", read=raw.tell())
+                data["votes"] = _join_devices(data.get("votes", []), data.pop("devices", {}))
+                data["voters"] = {vote.get("voter") for vote in data["votes"]}
+                self._data = data
+            return self._data
+
+    def _read_only(self, *args, **kwargs):
+        raise PermissionError(f"{self.file_path} is an archived election and can't be changed")
+
+    append_votes = add_ballots = clear_votes = delete_voter = update_metadata = set_settings = _read_only
+
+    def load_votes(self):
+        return list(self._load()["votes"])
+
+    def count_votes(self):
+        return len(self._load()["votes"])
+
+    def get_settings(self):
+        return dict(self._load().get("settings", DEFAULT_SETTINGS))
+
+    def has_voted(self, voter_name):
+        return voter_name in self._load()["voters"]
+
+    def list_voters(self):
+        return sorted(v for v in self._load()["voters"] if v)
+
+    def candidates(self, category):
+        # The frozen tallies only hold first choices, so read the votes
+        return sorted({vote["candidate"] for vote in self._load()["votes"] if vote.get("category") == category})
+
+    def tallies(self):
+        return {category: dict(candidates) for category, candidates in self._load()["tallies"].items()}
+
+    def tally(self, category):
+        return dict(self._load()["tallies"].get(category, {}))
+
+    def frozen_results(self):
+        return self._load().get("results")
+
+    def version(self):
+        return 0
+
+
+# --- SQLite ------------------------------------------------------------------
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS votes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    category TEXT NOT NULL,
+    candidate TEXT NOT NULL,
+    voter TEXT,
+    timestamp TEXT NOT NULL,
+    metadata TEXT,  -- only in databases from before the devices table; see _migrate_devices
+    device TEXT,
+    rank INTEGER  -- preference on a ranked ballot, NULL for a plain vote
+);
+CREATE INDEX IF NOT EXISTS idx_votes_voter ON votes (voter);
+CREATE INDEX IF NOT EXISTS idx_votes_category_candidate ON votes (category, candidate);
+CREATE TABLE IF NOT EXISTS devices (
+    fingerprint TEXT PRIMARY KEY,
+    metadata TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', '0');
+CREATE TABLE IF NOT EXISTS vote_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    version INTEGER NOT NULL,
+    op TEXT NOT NULL,
+    category TEXT,
+    candidate TEXT,
+    voter TEXT,
+    timestamp TEXT,
+    device TEXT,
+    rank INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_vote_changes_version ON vote_changes (version);
+"""
+
+# Every insert into / delete from votes is logged in vote_changes with the version
+# its transaction commits as, for changes_since(). The triggers are created after
+# _migrate_columns adds votes.device and votes.rank. The first triggers didn't log
+# the rank, so they are swapped for the _v2 ones in the same transaction.
+_SQLITE_CHANGE_LOG = """
+BEGIN IMMEDIATE;
+DROP TRIGGER IF EXISTS votes_log_insert;
+DROP TRIGGER IF EXISTS votes_log_delete;
+CREATE TRIGGER IF NOT EXISTS votes_log_insert_v2 AFTER INSERT ON votes BEGIN
+    INSERT INTO vote_changes (version, op, category, candidate, voter, timestamp, device, rank)
+    VALUES ((SELECT CAST(value AS INTEGER) + 1 FROM meta WHERE key = 'version'),
+            'add', NEW.category, NEW.candidate, NEW.voter, NEW.timestamp, NEW.device, NEW.rank);
+END;
+CREATE TRIGGER IF NOT EXISTS votes_log_delete_v2 AFTER DELETE ON votes BEGIN
+    INSERT INTO vote_changes (version, op, category, candidate, voter, timestamp, device, rank)
+    VALUES ((SELECT CAST(value AS INTEGER) + 1 FROM meta WHERE key = 'version'),
+            'delete', OLD.category, OLD.candidate, OLD.voter, OLD.timestamp, OLD.device, OLD.rank);
+END;
+INSERT OR IGNORE INTO meta (key, value) SELECT 'changes_floor', value FROM meta WHERE key = 'version';
+COMMIT;
+"""
+
+# Votes with their device's metadata joined back on, as _row_to_vote expects
+_SELECT_VOTES = """
+SELECT v.category, v.candidate, v.voter, v.timestamp, d.metadata, v.rank
+FROM votes v LEFT JOIN devices d ON d.fingerprint = v.device
+"""
+
+_DELETE_UNUSED_DEVICES = """
+DELETE FROM devices WHERE fingerprint NOT IN (SELECT device FROM votes WHERE device IS NOT NULL)
+"""
+
+
+class SqliteStorage(Storage):
+    """Votes in an indexed SQLite table. WAL mode lets readers run alongside the single writer."""
+
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(_SQLITE_SCHEMA)
+        # Migration: Ensure settings exist
+        conn.execute(
+            "INSERT OR IGNORE INTO meta (key, value) VALUES ('settings', ?)",
+            (json.dumps(DEFAULT_SETTINGS),),
+        )
+        self._migrate_columns(conn)
+        self._migrate_devices(conn)
+        conn.executescript(_SQLITE_CHANGE_LOG)
+
+    @staticmethod
+    def _migrate_columns(conn):
+        """Adds columns that older databases don't have yet."""
+        for table, column, definition in (
+            ("votes", "device", "TEXT"), ("votes", "rank", "INTEGER"), ("vote_changes", "rank", "INTEGER"),
+        ):
+            if column not in [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def _migrate_devices(self, conn):
+        """Moves inline votes.metadata (older databases) into the devices table."""
+        if not conn.execute("SELECT 1 FROM votes WHERE metadata IS NOT NULL LIMIT 1").fetchone():
+            return
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT id, metadata FROM votes WHERE metadata IS NOT NULL").fetchall()
+            updates = []
+            for vote_id, metadata in rows:
+                fingerprint = self._store_device(conn, json.loads(metadata))
+                updates.append((fingerprint, vote_id))
+            conn.executemany("UPDATE votes SET device = ?, metadata = NULL WHERE id = ?", updates)
+
+    def _conn(self):
+        # sqlite3 connections can't be shared across threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.file_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """BEGIN IMMEDIATE ... COMMIT, bumping the data version if anything changed."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            changes = conn.total_changes
+            yield conn
+            if conn.total_changes != changes:
+                conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+                self._prune_change_log(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _prune_change_log(conn):
+        """Keeps the last CHANGE_LOG_SIZE changes once the log has grown to twice that."""
+        oldest, newest = conn.execute("SELECT MIN(seq), MAX(seq) FROM vote_changes").fetchone()
+        if newest is None or newest - oldest < 2 * CHANGE_LOG_SIZE:
+            return
+        cutoff = newest - CHANGE_LOG_SIZE
+        floor = conn.execute("SELECT MAX(version) FROM vote_changes WHERE seq <= ?", (cutoff,)).fetchone()[0]
+        conn.execute("DELETE FROM vote_changes WHERE seq <= ?", (cutoff,))
+        conn.execute("UPDATE meta SET value = ? WHERE key = 'changes_floor'", (str(floor),))
+
+    @staticmethod
+    def _row_to_vote(row):
+        category, candidate, voter, timestamp, metadata, rank = row
+        vote = {"category": category, "candidate": candidate, "timestamp": timestamp, "voter": voter}
+        if metadata:
+            vote["metadata"] = json.loads(metadata)
+        if rank:
+            vote["rank"] = rank
+        return vote
+
+    @staticmethod
+    def _store_device(conn, metadata):
+        """Adds metadata to the devices table if it's new and returns its fingerprint."""
+        if not metadata:
+            return None
+        fingerprint = device_fingerprint(metadata)
+        conn.execute(
+            "INSERT OR IGNORE INTO devices (fingerprint, metadata) VALUES (?, ?)",
+            (fingerprint, json.dumps(metadata)),
+        )
+        return fingerprint
+
+    def load_votes(self):
+        return [self._row_to_vote(row) for row in self._conn().execute(_SELECT_VOTES + " ORDER BY v.id")]
+
+    def count_votes(self):
+        return self._conn().execute("SELECT COUNT(*) FROM votes").fetchone()[0]
+
+    def votes_page(self, offset, limit):
+        rows = self._conn().execute(_SELECT_VOTES + " ORDER BY v.id LIMIT ? OFFSET ?", (limit, offset))
+        return [self._row_to_vote(row) for row in rows]
+
+    def iter_votes(self, chunk_size=1000):
+        # A dedicated connection so the cursor can stay open while the caller consumes chunks
+        conn = sqlite3.connect(self.file_path, timeout=30)
+        try:
+            cursor = conn.execute(_SELECT_VOTES + " ORDER BY v.id")
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield [self._row_to_vote(row) for row in rows]
+        finally:
+            conn.close()
+
+    def _insert(self, conn, votes):
+        conn.executemany(
+            "INSERT INTO votes (category, candidate, voter, timestamp, device, rank) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (v["category"], v["candidate"], v.get("voter"), v["timestamp"],
+                 self._store_device(conn, v.get("metadata")), v.get("rank"))
+                for v in votes
+            ],
+        )
+
+    def append_votes(self, votes):
+        with self._transaction() as conn:
+            self._insert(conn, votes)
+
+    def add_ballots(self, ballots):
+        results = []
+        # NORMAL only syncs the WAL at checkpoints; a group commit is worth a real fsync
+        self._conn().execute("PRAGMA synchronous=FULL")
+        try:
+            with self._transaction() as conn:
+                for voter_name, votes in ballots:
+                    exists = conn.execute("SELECT 1 FROM votes WHERE voter = ? LIMIT 1", (voter_name,)).fetchone()
+                    if not exists:
+                        self._insert(conn, votes)
+                    results.append(not exists)
+        finally:
+            self._conn().execute("PRAGMA synchronous=NORMAL")
+        return results
+
+    def clear_votes(self, before=None):
+        with self._transaction() as conn:
+            if before:
+                before()  # its reads share this connection, so they see the same snapshot
+            conn.execute("DELETE FROM votes")
+            conn.execute("DELETE FROM devices")
+            # A wipe isn't worth replaying vote by vote: make everyone reload
+            conn.execute("DELETE FROM vote_changes")
+            conn.execute(
+                "UPDATE meta SET value = (SELECT CAST(value AS INTEGER) + 1 FROM meta WHERE key = 'version')"
+                " WHERE key = 'changes_floor'"
+            )
+
+    def delete_voter(self, voter_name):
+        # An indexed delete; sweeping up devices nobody uses any more means a
+        # full scan of votes, so that's left to the background compact()
+        with self._transaction() as conn:
+            deleted = conn.execute("DELETE FROM votes WHERE voter = ?", (voter_name,)).rowcount
+        if deleted:
+            _compact_soon(self)
+        return deleted
+
+    def compact(self):
+        """Drops devices no vote refers to any more."""
+        with self._transaction() as conn:
+            conn.execute(_DELETE_UNUSED_DEVICES)
+
+    def update_metadata(self, voter_name, updates):
+        # Only the device upsert and the re-point; the devices this leaves unused
+        # are swept up by the background compact(), as after delete_voter()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT v.id, d.metadata FROM votes v LEFT JOIN devices d ON d.fingerprint = v.device"
+                " WHERE v.voter = ?",
+                (voter_name,),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE votes SET device = ? WHERE id = ?",
+                [
+                    (self._store_device(conn, {**json.loads(metadata or "{}"), **updates}), vote_id)
+                    for vote_id, metadata in rows
+                ],
+            )
+        if rows:
+            _compact_soon(self)
+
+    def get_settings(self):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'settings'").fetchone()
+        return json.loads(row[0]) if row else dict(DEFAULT_SETTINGS)
+
+    def set_settings(self, settings):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('settings', ?)", (json.dumps(settings),)
+            )
+
+    def has_voted(self, voter_name):
+        row = self._conn().execute("SELECT 1 FROM votes WHERE voter = ? LIMIT 1", (voter_name,)).fetchone()
+        return row is not None
+
+    def list_voters(self):
+        rows = self._conn().execute(
+            "SELECT DISTINCT voter FROM votes WHERE voter IS NOT NULL AND voter != '' ORDER BY voter"
+        )
+        return [row[0] for row in rows]
+
+    def candidates(self, category):
+        rows = self._conn().execute(
+            "SELECT DISTINCT candidate FROM votes WHERE category = ? ORDER BY candidate", (category,)
+        )
+        return [row[0] for row in rows]
+
+    def tallies(self):
+        results = {}
+        rows = self._conn().execute(
+            "SELECT category, candidate, COUNT(*) FROM votes WHERE rank IS NULL OR rank = 1"
+            " GROUP BY category, candidate"
+        )
+        for category, candidate, count in rows:
+            results.setdefault(category, {})[candidate] = count
+        return results
+
+    def tally(self, category):
+        rows = self._conn().execute(
+            "SELECT candidate, COUNT(*) FROM votes WHERE category = ? AND (rank IS NULL OR rank = 1)"
+            " GROUP BY candidate", (category,)
+        )
+        return dict(rows.fetchall())
+
+    def ranked_ballots(self, category):
+        rows = self._conn().execute(
+            "SELECT COALESCE(voter, -id), candidate FROM votes WHERE category = ? ORDER BY 1, COALESCE(rank, 1)",
+            (category,),
+        )
+        rankings = {}
+        for voter, candidate in rows:
+            rankings.setdefault(voter, []).append(candidate)
+        return dict(ranked.count_ballots(rankings.values()))
+
+    def voter_summaries(self):
+        import pandas as pd
+
+        conn = self._conn()
+        stats = pd.DataFrame(
+            conn.execute(
+                "SELECT voter, SUM(rank IS NULL OR rank = 1), MAX(timestamp) FROM votes WHERE voter IS NOT NULL"
+                " GROUP BY voter"
+            ).fetchall(),
+            columns=["voter", "votes", "last"],
+        )
+        # Only the winning metadata row per voter gets decoded
+        latest = dict(conn.execute(
+            """
+            SELECT latest.voter, d.metadata FROM (
+                SELECT voter, device,
+                       ROW_NUMBER() OVER (PARTITION BY voter ORDER BY timestamp DESC, id) AS rank
+                FROM votes WHERE voter IS NOT NULL AND device IS NOT NULL
+            ) AS latest JOIN devices d ON d.fingerprint = latest.device
+            WHERE latest.rank = 1
+            """
+        ))
+        stats["last"] = pd.to_datetime(stats["last"], format="ISO8601").astype("datetime64[us]")
+        stats["metadata"] = [json.loads(latest[voter]) if voter in latest else None for voter in stats["voter"].tolist()]
+        return stats
+
+    def versioned_tallies(self):
+        conn = self._conn()
+        conn.execute("BEGIN")  # one read snapshot for the version and the counts
+        try:
+            return self.version(), self.tallies()
+        finally:
+            conn.execute("COMMIT")
+
+    def version(self):
+        return int(self._conn().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0])
+
+    def changes_since(self, version):
+        conn = self._conn()
+        conn.execute("BEGIN")  # one read snapshot for the version check and the log
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('version', 'changes_floor')"))
+            current, floor = int(meta["version"]), int(meta["changes_floor"])
+            if version < floor or version > current:
+                return current, None
+            rows = conn.execute(
+                """
+                SELECT c.op, c.category, c.candidate, c.voter, c.timestamp, d.metadata, c.rank
+                FROM vote_changes c LEFT JOIN devices d ON d.fingerprint = c.device
+                WHERE c.version > ? ORDER BY c.seq
+                """,
+                (version,),
+            )
+            return current, [(row[0], self._row_to_vote(row[1:])) for row in rows]
+        finally:
+            conn.execute("COMMIT")
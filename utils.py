@@ -1,4 +1,7 @@
+import functools
 import streamlit as st
+import instrumentation
+import roster as roster_registry
 
 # Updated to trigger refresh on Streamlit Cloud
 RANELADS = sorted([
@@ -7,6 +10,16 @@ RANELADS = sorted([
     "Josh", "Jam", "Monz", "Ois", "Ollie", "Con 💩💩", "Kill 👑"
 ])
 
+# User-Agent marker -> device label in a voter's metadata, checked in order
+DEVICE_MARKERS = [
+    ("iPhone", "iPhone"),
+    ("Android", "Android Phone"),
+    ("iPad", "iPad"),
+    ("Macintosh", "Mac Desktop"),
+    ("Windows", "Windows Desktop"),
+]
+DEVICES = [device for _, device in DEVICE_MARKERS]
+
 def load_css():
     """Loads custom CSS with no leading indentation to avoid markdown code blocks."""
     css = """<style>
@@ -161,38 +174,49 @@ def show_celebration():
     st.markdown(rain_html, unsafe_allow_html=True)
 
 def decorate_name(name):
-    """Adds crowns or other emojis to specific names for display."""
-    if not name:
-        return name
-    
-    clean_name = name.replace(" 👑", "").replace(" 💩💩", "").strip()
-    
-    if clean_name == "Con":
-        return f"{clean_name} 💩💩"
-    
-    vips = ["David", "Rob", "Kill", "Jack", "Simo"]
-    if clean_name in vips:
-        return f"{clean_name} 👑"
-    return name
-
-def render_horse_race_html(category, results_df):
-    """Generates the HTML for a single category horse race with NO leading indentation."""
-    # Create a map of existing votes
-    votes_map = {row['Candidate']: row['Count'] for _, row in results_df[results_df['Category'] == category].iterrows()}
+    """Adds crowns or other emojis to specific names for display.
+
+    The badges come from the active election (see roster.py); this is a dict lookup.
+    """
+    return roster_registry.current().display(name)
+
+@instrumentation.timed("utils.render_horse_race_html")
+def render_horse_race_html(category, results, roster=None, rounds=None, unit="votes"):
+    """Generates the HTML for a single category horse race with NO leading indentation.
+
+    results is the category's {candidate: count} tally (the old results DataFrame is
+    still accepted); roster is the election's line-up, RANELADS by default.
+    For a ranked category pass the ranked result's rounds instead: the horses run
+    through them in turn and drop back as they are eliminated (no rounds at all, before
+    any ballots, leaves everyone at the gate). unit labels the scores.
+    Identical tallies return the cached HTML.
+    """
+    roster = tuple(roster or RANELADS)
+    names = roster_registry.current()
+    if rounds is not None:
+        return _render_ranked_race(category, tuple(frozenset(r.items()) for r in rounds), roster, unit, names)
+    if not isinstance(results, dict):
+        rows = results[results['Category'] == category]
+        results = dict(zip(rows['Candidate'], rows['Count']))
+    return _render_horse_race(category, frozenset(results.items()), roster, names)
+
+@functools.lru_cache(maxsize=256)
+def _render_horse_race(category, counts, roster, names):
+    votes_map = dict(counts)
     
     # We want ALL horses to appear on the track
     # Header - NO INDENTATION to avoid triggering markdown code blocks
-    html = f'<div class="race-track-container"><div class="race-track-header">{category}</div><div class="finish-line"></div>'
+    parts = [f'<div class="race-track-container"><div class="race-track-header">{category}</div><div class="finish-line"></div>']
     
     # Track only Ranelads who have at least one vote to avoid overcrowding the screen
     voted_horses = []
-    for r in RANELADS:
+    for r in roster:
         count = votes_map.get(r, 0)
         if count > 0:
             voted_horses.append({'name': r, 'count': count})
     
     if not voted_horses:
-        html += '<div style="color: white; text-align: center; padding: 2rem;">The horses are still in the gate... (No votes yet)</div>'
+        parts.append('<div style="color: white; text-align: center; padding: 2rem;">The horses are still in the gate... (No votes yet)</div>')
     else:
         # Sort by count descending
         voted_horses = sorted(voted_horses, key=lambda x: x['count'], reverse=True)
@@ -201,16 +225,70 @@ def render_horse_race_html(category, results_df):
         finish_line_votes = 15
         
         for horse in voted_horses:
-            name = decorate_name(horse['name'])
+            name = names.display(horse['name'])
             count = horse['count']
             
             # Progress: absolute based on vote count
             progress = min((count / finish_line_votes) * 85, 85)
             
-            html += f'<div class="horse-lane"><div class="horse-container" style="left: {progress}%;"><span class="horse-emoji">🐎</span><span class="horse-name">{name} ({count} votes)</span></div></div>'
+            parts.append(f'<div class="horse-lane"><div class="horse-container" style="left: {progress}%;"><span class="horse-emoji">🐎</span><span class="horse-name">{name} ({count} votes)</span></div></div>')
             
-    html += '</div>'
-    return html
+    parts.append('</div>')
+    return ''.join(parts)
+
+instrumentation.register_lru_cache("utils.render_horse_race_html", _render_horse_race)
+
+# Seconds each round of a ranked race is on screen
+ROUND_SECONDS = 1.5
+
+@functools.lru_cache(maxsize=64)
+def _render_ranked_race(category, frozen_rounds, roster, unit, names):
+    rounds = [dict(r) for r in frozen_rounds]
+    final = rounds[-1] if rounds else {}
+    # Anyone who scored in some round gets a lane: survivors first, then the
+    # eliminated in reverse order of going out
+    last_round = {}
+    for number, scores in enumerate(rounds):
+        for name in scores:
+            last_round[name] = number
+    horses = [r for r in roster if any(scores.get(r, 0) > 0 for scores in rounds)]
+    horses += sorted(n for n in last_round if n not in roster and any(s.get(n, 0) > 0 for s in rounds))
+    horses.sort(key=lambda n: (-last_round[n], -rounds[last_round[n]].get(n, 0)))
+
+    header = category if len(rounds) <= 1 else f"{category} · {len(rounds)} rounds"
+    parts = [f'<div class="race-track-container"><div class="race-track-header">{header}</div><div class="finish-line"></div>']
+    if not horses:
+        parts.append('<div style="color: white; text-align: center; padding: 2rem;">The horses are still in the gate... (No votes yet)</div>')
+        parts.append('</div>')
+        return ''.join(parts)
+
+    finish = max(15, max(max(scores.values(), default=0) for scores in rounds))
+    race_id = f"{abs(hash((category, frozen_rounds))):x}"  # keyframe names unique to this race
+    styles = []
+    for lane, name in enumerate(horses):
+        positions = []
+        for number, scores in enumerate(rounds):
+            if name in scores:
+                positions.append((round(min(scores[name] / finish * 85, 85), 1), 1))
+            else:
+                positions.append((positions[-1][0], 0.35))
+        label = f"{final[name]} {unit}" if name in final else f"out after round {last_round[name] + 1}"
+        style = f"left: {positions[-1][0]}%; opacity: {positions[-1][1]};"
+        if len(rounds) > 1:
+            frames = " ".join(
+                f"{number * 100 / (len(rounds) - 1):.1f}% {{ left: {left}%; opacity: {opacity}; }}"
+                for number, (left, opacity) in enumerate(positions)
+            )
+            styles.append(f"@keyframes race-{race_id}-{lane} {{ {frames} }}")
+            style += (f" animation: jitter 0.2s infinite ease-in-out,"
+                      f" race-{race_id}-{lane} {ROUND_SECONDS * (len(rounds) - 1)}s ease-in-out both;")
+        parts.append(f'<div class="horse-lane"><div class="horse-container" style="{style}"><span class="horse-emoji">🐎</span><span class="horse-name">{names.display(name)} ({label})</span></div></div>')
+    if styles:
+        parts.insert(1, f"<style>{' '.join(styles)}</style>")
+    parts.append('</div>')
+    return ''.join(parts)
+
+instrumentation.register_lru_cache("utils.render_ranked_race", _render_ranked_race)
 
 def get_category_emoji(category):
     emojis = {
@@ -0,0 +1,106 @@
+"""Write-behind queue that group-commits ballots.
+
+At the awards everybody votes in the same couple of minutes. Instead of each
+ballot paying for its own lock, journal write and fsync, submit() queues it and
+a background thread commits whatever has arrived every GROUP_COMMIT_WINDOW
+seconds (or as soon as GROUP_COMMIT_MAX are waiting) with one
+Storage.add_ballots call. Each caller gets a Future that resolves to
+add_ballot's True/False once its batch is durably stored.
+"""
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import Future
+import instrumentation
+
+GROUP_COMMIT_WINDOW = 0.005
+GROUP_COMMIT_MAX = 64
+
+_writers = {}  # storage key -> WriteBehind
+_writers_lock = threading.Lock()
+
+
+def writer_for(storage):
+    """The process-wide WriteBehind for storage."""
+    with _writers_lock:
+        writer = _writers.get(storage.key)
+        if writer is None:
+            writer = _writers[storage.key] = WriteBehind(storage)
+        return writer
+
+
+def flush_all():
+    for writer in list(_writers.values()):
+        writer.flush()
+
+atexit.register(flush_all)
+
+
+class WriteBehind:
+    """Queues ballots for one storage and commits them in groups from a daemon thread."""
+
+    def __init__(self, storage, window=GROUP_COMMIT_WINDOW, max_batch=GROUP_COMMIT_MAX):
+        self.storage = storage
+        self.window = window
+        self.max_batch = max_batch
+        self._cond = threading.Condition()
+        self._pending = []  # (voter_name, votes, future)
+        self._busy = False
+        self._thread = None
+        self._pid = None
+
+    def submit(self, voter_name, votes):
+        """Queues a ballot and returns a Future for add_ballot's result."""
+        future = Future()
+        with self._cond:
+            if self._pid != os.getpid():
+                # Forked: the writer thread (and the parent's queue) didn't come with us
+                self._pending, self._busy = [], False
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+            self._pending.append((voter_name, votes, future))
+            self._cond.notify_all()
+        return future
+
+    def flush(self):
+        """Blocks until everything submitted so far has been committed."""
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            while self._pending or self._busy:
+                self._cond.wait()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # Give other voters a moment to join this batch
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                self._busy = True
+            try:
+                self._commit(batch)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    @instrumentation.timed("WriteBehind.commit")
+    def _commit(self, batch):
+        try:
+            results = self.storage.add_ballots([(voter_name, votes) for voter_name, votes, _ in batch])
+        except Exception as exc:
+            for _, _, future in batch:
+                future.set_exception(exc)
+        else:
+            for (_, _, future), stored in zip(batch, results):
+                future.set_result(stored)